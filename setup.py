@@ -13,7 +13,7 @@ setup(
     packages=find_packages('src'),
     package_dir={'': 'src'},
     package_data={
-        "data.db_data": ["*.json"],
+        "data.db_data": ["*.json", "*.ndjson"],
         "data.cfg_global": ["*.json"],
         "data.cfg_tests": ["*.json"],
         "data.jobs_data": ["*.*"],
@@ -23,5 +23,6 @@ setup(
     author='Efi Ovadia',
     author_email='efovadia@gmail.com',
     license='proprietary',
-    install_requires = [required, 'pytest']
+    install_requires = [required, 'pytest'],
+    extras_require={"numpy": ["numpy"]}
 )
\ No newline at end of file
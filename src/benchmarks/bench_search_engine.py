@@ -0,0 +1,166 @@
+"""
+Benchmark of the search engine's jobs and search API on synthetic data.
+
+run from the src folder, e.g.:
+    python -m benchmarks.bench_search_engine --products 10000 --sites 10000 --searches 1000 --save baseline.json
+    python -m benchmarks.bench_search_engine --products 10000 --sites 10000 --searches 1000 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from tests import settings
+from clients.api.search_web_activities import SearchWebsiteActivities
+from benchmarks.synthetic_data import SyntheticCatalog
+
+logging.getLogger()
+
+
+def latency_stats(latencies: list) -> dict:
+    """
+    :param latencies: per call latencies in seconds
+    :return: p50 and p99 latencies in milliseconds
+    """
+    if len(latencies) < 2:
+        return {"p50_ms": round(latencies[0] * 1000, 3) if latencies else None, "p99_ms": None}
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {"p50_ms": round(quantiles[49] * 1000, 3), "p99_ms": round(quantiles[98] * 1000, 3)}
+
+
+def throughput(rows: int, seconds: float) -> dict:
+    return {"rows": rows, "seconds": round(seconds, 6), "rows_per_sec": round(rows / seconds) if seconds else None}
+
+
+def timed(func, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    res = func(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def run_benchmark(products: int, sites: int, searches: int, batch_sites: int = 0, seed: int = 0,
+                  search_cache_size: int = 0, work_dir: str = None) -> dict:
+    """
+    generate a synthetic catalog and websites stream, and time each job and the search API on a fresh DB
+    :param products: number of products in the catalog
+    :param sites: number of websites inserted one by one with insert_new_site_into_search_engine_api
+    :param searches: number of get_search_term_options calls
+    :param batch_sites: number of additional websites inserted with insert_new_sites (in batches of 1000)
+    :param seed: random seed of the synthetic data
+    :param search_cache_size: search results cache size, 0 measures the DB query of every search
+    :param work_dir: folder for the DB and data files, defaults to a temp folder
+    :return: a dict of the results per job
+    """
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix='search_engine_bench_'))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    for db_file in ('bench.db', 'bench.db-wal', 'bench.db-shm'):
+        (work_dir / db_file).unlink(missing_ok=True)
+    catalog = SyntheticCatalog(products, seed=seed)
+    catalog.write_products_insertion_file(work_dir / 'products.json')
+    catalog.write_products_feed(work_dir / 'products.ndjson')
+    # absolute file names override the package folders of the settings
+    client = SearchWebsiteActivities(**{**vars(settings), "db_name": str(work_dir / 'bench.db'),
+                                        "products_insert_fn": str(work_dir / 'products.json'),
+                                        "data_jobs_fn": str(work_dir / 'jobs.txt'),
+                                        "search_cache_size": search_cache_size,
+                                        "is_delete_tables": False, "is_create_tables": True,
+                                        "is_truncate_tables": True})
+    client.tear_down()
+    client.insert_ranking_parameters()
+    results = {}
+
+    _, seconds = timed(client.insert_products_job)
+    results['insert_products_job'] = throughput(products, seconds)
+    client.truncate_tables(['products', 'product_keywords'])
+    res, seconds = timed(client.insert_products_feed_job, work_dir / 'products.ndjson', resume=False)
+    results['insert_products_feed_job'] = throughput(res.data, seconds)
+
+    latencies = []
+    for site in catalog.iter_sites(sites):
+        _, seconds = timed(client.insert_new_site_into_search_engine_api, **site)
+        latencies.append(seconds)
+    results['insert_new_site_into_search_engine_api'] = {**throughput(sites, sum(latencies)),
+                                                         **latency_stats(latencies)}
+    if batch_sites:
+        start = time.perf_counter()
+        for batch in client.batched(catalog.iter_sites(batch_sites), 1000):
+            client.insert_new_sites(batch)
+        results['insert_new_sites'] = throughput(batch_sites, time.perf_counter() - start)
+
+    _, seconds = timed(client.update_ranking_job)
+    results['update_ranking_job'] = throughput(sites + batch_sites, seconds)
+
+    latencies = []
+    for search_term in catalog.iter_search_terms(searches):
+        _, seconds = timed(client.get_search_term_options, search_term)
+        latencies.append(seconds)
+    results['get_search_term_options'] = {**throughput(searches, sum(latencies)), **latency_stats(latencies)}
+    client.close()
+    return {"scale": {"products": products, "sites": sites, "batch_sites": batch_sites, "searches": searches,
+                      "seed": seed, "search_cache_size": search_cache_size},
+            "env": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                    "platform": platform.platform()},
+            "results": results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    compare a benchmark report to a baseline report
+    :param report: the current report
+    :param baseline: a former report, of the same scale
+    :param tolerance: allowed relative slowdown (0.2 = 20%) before a metric is reported as a regression
+    :return: a list of regressions, e.g. "update_ranking_job rows_per_sec: 5000 -> 3000 (-40.0%)"
+    """
+    regressions = []
+    for job, metrics in report['results'].items():
+        base_metrics = baseline['results'].get(job, {})
+        for metric, value in metrics.items():
+            base_value = base_metrics.get(metric)
+            if metric not in ('rows_per_sec', 'p50_ms', 'p99_ms') or not value or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            # more rows/sec is better, less latency is better
+            slowdown = -change if metric == 'rows_per_sec' else change
+            logging.info(F"{job} {metric}: {base_value} -> {value} ({change:+.1%})")
+            if slowdown > tolerance:
+                regressions.append(F"{job} {metric}: {base_value} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sites', type=int, default=10000)
+    parser.add_argument('--batch-sites', type=int, default=0, help='websites inserted with insert_new_sites')
+    parser.add_argument('--searches', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--search-cache-size', type=int, default=0)
+    parser.add_argument('--work-dir', help='folder for the DB and data files, defaults to a temp folder')
+    parser.add_argument('--save', help='save the report as a json baseline file')
+    parser.add_argument('--compare', help='json baseline file to compare the report to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown vs the baseline')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s, [%(levelname)s] %(message)s')
+    # the clients log every call at INFO level, which would dominate the measured latencies
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(args.products, args.sites, args.searches, batch_sites=args.batch_sites, seed=args.seed,
+                           search_cache_size=args.search_cache_size, work_dir=args.work_dir)
+    logging.getLogger().setLevel(logging.INFO)
+    print(json.dumps(report, indent=2))
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2))
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), tolerance=args.tolerance)
+        for regression in regressions:
+            logging.warning(F"regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
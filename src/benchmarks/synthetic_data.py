@@ -0,0 +1,101 @@
+import json
+import random
+from itertools import accumulate
+from typing import Iterator, List
+
+
+class SyntheticCatalog():
+    """
+    a reproducible synthetic products catalog, websites stream and search terms stream.
+    keywords (and products, for the websites and the searches) are drawn from Zipf distributions, so a few head
+    keywords are shared by many products and searched for most often, as in real traffic.
+    """
+
+    def __init__(self, products: int, keywords: int = None, keywords_per_product: int = 5, zipf_s: float = 1.1,
+                 seed: int = 0):
+        """
+        :param products: number of products in the catalog
+        :param keywords: size of the keywords vocabulary, defaults to a tenth of the products (at least 100)
+        :param keywords_per_product: max number of keywords per product
+        :param zipf_s: the Zipf distribution's exponent
+        :param seed: random seed, the same seed generates the same data
+        """
+        self.products = products
+        vocabulary_size = keywords or max(100, products // 10)
+        # single token keywords of a fixed width, so a search term matches (as a full-text prefix) its own keyword only,
+        # and neither another keyword nor the products' names and descriptions
+        self.vocabulary = [F"kw{idx:0{len(str(vocabulary_size - 1))}d}" for idx in range(vocabulary_size)]
+        self.keywords_per_product = keywords_per_product
+        self.seed = seed
+        self._keywords_weights = list(accumulate(1 / rank ** zipf_s for rank in range(1, len(self.vocabulary) + 1)))
+        self._products_weights = list(accumulate(1 / rank ** zipf_s for rank in range(1, products + 1)))
+
+    def product_name(self, idx: int) -> str:
+        return F"product {idx}"
+
+    def product_keywords(self, idx: int) -> List[str]:
+        """
+        :param idx: product index
+        :return: the product's keywords (always the same ones for the same index)
+        """
+        rnd = random.Random(F"{self.seed}:{idx}")
+        count = rnd.randint(1, self.keywords_per_product)
+        keywords = rnd.choices(self.vocabulary, cum_weights=self._keywords_weights, k=count)
+        return list(dict.fromkeys(keywords))
+
+    def iter_products(self) -> Iterator[dict]:
+        """
+        :return: an iterator of product records (name, description, keywords), as in the products feed
+        """
+        for idx in range(self.products):
+            yield {"name": self.product_name(idx), "description": F"synthetic product {idx}",
+                   "keywords": ', '.join(self.product_keywords(idx)) + ','}
+
+    def write_products_feed(self, path) -> int:
+        """
+        write the catalog as a NDJSON products feed
+        :param path: feed file path
+        :return: number of written products
+        """
+        with open(path, 'w') as feed:
+            for product in self.iter_products():
+                feed.write(json.dumps(product) + '\n')
+        return self.products
+
+    def write_products_insertion_file(self, path, table_name: str = 'products') -> int:
+        """
+        write the catalog in the json insertion file format of insert_products_job (rows as typed arrays)
+        :param path: json file path
+        :param table_name: the products table name
+        :return: number of written products
+        """
+        with open(path, 'w') as file:
+            file.write(json.dumps({table_name: {"columns": "name, description, keywords", "data": []}})[:-3])
+            for idx, product in enumerate(self.iter_products()):
+                row = [product['name'], product['description'], product['keywords']]
+                file.write((', ' if idx else '') + json.dumps(row))
+            file.write(']}}')
+        return self.products
+
+    def iter_sites(self, sites: int) -> Iterator[dict]:
+        """
+        :param sites: number of websites
+        :return: an iterator of website records (insert_new_site_into_search_engine_api arguments) of popular
+                 (Zipf distributed) products, with the product's keywords
+        """
+        rnd = random.Random(F"{self.seed}:sites")
+        for site_idx in range(sites):
+            idx = rnd.choices(range(self.products), cum_weights=self._products_weights)[0]
+            keywords = self.product_keywords(idx)
+            yield {"url": F"www.site{site_idx}.com", "product": self.product_name(idx),
+                   "keywords": {F"key{key_idx}": keyword for key_idx, keyword in enumerate(keywords, start=1)},
+                   "seniority": rnd.randint(1, 365), "ref": rnd.randint(0, 100)}
+
+    def iter_search_terms(self, searches: int) -> Iterator[str]:
+        """
+        :param searches: number of searches
+        :return: an iterator of Zipf distributed search terms
+        """
+        rnd = random.Random(F"{self.seed}:searches")
+        for _ in range(searches):
+            yield rnd.choices(self.vocabulary, cum_weights=self._keywords_weights)[0]
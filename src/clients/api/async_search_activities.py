@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List
+from clients.api.search_web_activities import SearchWebsiteActivities
+
+logging.getLogger()
+
+
+class AsyncSearchWebsiteActivities():
+    """
+    an asyncio front end of SearchWebsiteActivities. the DB work runs on a bounded pool of threads; searches run
+    concurrently (each on a WAL read connection of the client's pool), while concurrent site insertions are queued and
+    coalesced by a single writer task into insert_new_sites batches, one transaction (and commit) per batch; a failed
+    batch is split until its bad sites are written alone.
+    a batch is written when it reaches batch_size sites, or batch_window seconds after its first site was queued.
+    """
+
+    def __init__(self, client: SearchWebsiteActivities, max_workers: int = None, batch_size: int = None,
+                 batch_window: float = None, max_queue_size: int = None):
+        """
+        :param client: the search engine client, which runs the DB work
+        :param max_workers: number of DB threads, defaults to the client's async_max_workers
+        :param batch_size: max number of sites per insertion transaction, defaults to async_batch_size
+        :param batch_window: max seconds a queued site waits for its batch to fill, defaults to async_batch_window
+        :param max_queue_size: max number of queued sites, beyond which the callers wait, defaults to
+                               async_max_queue_size
+        """
+        self.client = client
+        self.max_workers = max_workers or client.async_max_workers
+        self.batch_size = batch_size or client.async_batch_size
+        self.batch_window = client.async_batch_window if batch_window is None else batch_window
+        self.max_queue_size = max_queue_size or client.async_max_queue_size
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='search_engine_db')
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.batched_sites = 0
+        self.max_batch_size = 0
+        self._queue = None
+        self._writer = None
+        self._closing = False
+        self._closed = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """
+        start the writer task, in the running event loop
+        """
+        if self._closing:
+            raise RuntimeError(F"{type(self).__name__} is closed, no more sites can be queued")
+        if self._writer is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._writer = asyncio.get_running_loop().create_task(self._write_batches())
+
+    async def close(self):
+        """
+        write the queued sites, stop the writer task and the DB threads; the facade can not be used afterwards
+        """
+        self._closing = True
+        if self._writer is not None:
+            await self._queue.put(None)
+            await self._writer
+            self._writer = None
+        self.executor.shutdown(wait=True)
+        self._closed = True
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        run a blocking client call on the DB threads
+        :param func: a client method, e.g. self.client.update_ranking_job
+        :return: the call's result
+        """
+        if self._closed:
+            raise RuntimeError(F"{type(self).__name__} is closed, its DB threads were shut down")
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def get_search_term_options(self, search_term: str, limit: int = None, cursor: str = None,
+                                      mode: str = None) -> dict:
+        """
+        see SearchWebsiteActivities.get_search_term_options
+        """
+        return await self.run(self.client.get_search_term_options, search_term, limit=limit, cursor=cursor, mode=mode)
+
+    async def insert_new_site_into_search_engine_api(self, url: str, product: str, keywords: dict, seniority: int,
+                                                     ref: int = 0) -> str:
+        """
+        queue a new website to be inserted in the next batch, and wait for its batch to be committed
+        :param url: website url
+        :param seniority: age of website in days
+        :param keywords: search keywords which relevant to this website
+        :param ref: references to search website
+        :return: website's unique url
+        """
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(({"url": url, "product": product, "keywords": keywords, "seniority": seniority,
+                                "ref": ref}, future))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _write_batches(self):
+        """
+        the writer task: collect the queued sites into batches and insert each batch in a single transaction
+        """
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[tuple]):
+        """
+        :param batch: (site, future) pairs; each future gets its site's unique url, or its site's error. a failed
+                      batch is rolled back and its halves are written apart, so only the callers of the bad sites get
+                      an error
+        """
+        sites = [site for site, _ in batch]
+        event = {"type": "batch", "job": "insert_new_sites", "query": "insert_new_sites", "rows": len(batch)}
+        start = time.perf_counter()
+        unique_urls, error = None, None
+        try:
+            unique_urls = await self.run(self.client.insert_new_sites, sites)
+        except Exception as err:
+            error = err
+            event['error'] = str(err)
+        event['seconds'] = time.perf_counter() - start
+        self.client.metrics.record(event)
+        if error is not None and len(batch) > 1:
+            logging.info(F"a batch of {len(batch)} sites failed: {error}, its halves are written apart")
+            half = len(batch) // 2
+            await self._write_batch(batch[:half])
+            await self._write_batch(batch[half:])
+            return
+        self.batches += 1
+        self.batched_sites += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        if error is not None:
+            logging.error(F"a site failed: {error}")
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(error)
+            return
+        for (_, future), unique_url in zip(batch, unique_urls):
+            if not future.done():
+                future.set_result(unique_url)
+
+    def stats(self) -> dict:
+        return {"queue_depth": self._queue.qsize() if self._queue else 0, "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches, "batched_sites": self.batched_sites, "max_batch_size": self.max_batch_size,
+                "avg_batch_size": round(self.batched_sites / self.batches, 2) if self.batches else 0}
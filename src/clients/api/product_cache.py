@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+
+class ProductCatalogCache():
+    """
+    a bounded LRU cache of the products catalog for the websites ingestion: product name -> (product id, frozenset
+    of normalized keywords). loaded lazily, per missing name; a name which is not in the catalog is not cached, so a
+    product inserted later (by any writer) is found by the next lookup.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        """
+        :param max_size: max number of cached product names, 0 disables the cache
+        """
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, names: Iterable[str], loader: Callable[[list], dict]) -> dict:
+        """
+        :param names: product names
+        :param loader: loads the missing names from the DB, as a dict of name -> (product id, keywords frozenset)
+        :return: a dict of product name -> (product id, keywords frozenset) for the names which are in the catalog
+        """
+        products, missing = {}, []
+        with self._lock:
+            for name in set(names):
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    products[name] = self._entries[name]
+                else:
+                    self.misses += 1
+                    missing.append(name)
+            generation = self.generation
+        if not missing:
+            return products
+        loaded = loader(missing)
+        products.update(loaded)
+        with self._lock:
+            # products loaded while the catalog changed are not cached
+            if self.max_size and generation == self.generation:
+                self._entries.update(loaded)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return products
+
+    def invalidate(self):
+        """
+        drop all cached products, to be called when the products table changes
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
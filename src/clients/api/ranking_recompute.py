@@ -0,0 +1,63 @@
+import logging
+import sqlite3
+from pathlib import Path
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, without it the values are computed row by row
+    np = None
+
+logging.getLogger()
+
+
+def score_rows(rows: List[tuple]) -> List[tuple]:
+    """
+    recompute the values of ranking rows by the current grades, vectorized with numpy when it is installed
+    :param rows: ranking inputs: (id, website_product_rel_id, parameter_id, parameter_units, grade_per_unit,
+                 date_created)
+    :return: ranking rows: (id, website_product_rel_id, parameter_id, parameter_value, parameter_grade,
+             parameter_units, date_created)
+    """
+    ids, rel_ids, parameter_ids, units, grades, dates = zip(*rows)
+    if np is None:
+        values = [unit * grade for unit, grade in zip(units, grades)]
+    else:
+        # tolist brings the values back to python ints / floats, which sqlite can bind
+        values = (np.asarray(units) * np.asarray(grades)).tolist()
+    return list(zip(ids, rel_ids, parameter_ids, values, grades, units, dates))
+
+
+def score_shard(db_name: str, shard_path: str, queries: dict, first_id: int, last_id: int, chunk_size: int) -> int:
+    """
+    score the ranking rows of an id range into a shard DB file; run by the processes of recompute_ranking_job
+    :param db_name: the search engine's DB name (path), read on a read-only connection
+    :param shard_path: the shard DB file to be created
+    :param queries: the recompute queries of db_ranking_queries.json
+    :param first_id: the range's first ranking row id, exclusive
+    :param last_id: the range's last ranking row id, inclusive
+    :param chunk_size: ranking rows read and scored at a time
+    :return: number of scored rows
+    """
+    conn = sqlite3.connect(F"{Path(db_name).resolve().as_uri()}?mode=ro", uri=True)
+    # the shard is a scratch file, which is merged and deleted when the recompute ends
+    shard = sqlite3.connect(shard_path)
+    shard.execute("PRAGMA journal_mode = off;")
+    shard.execute("PRAGMA synchronous = off;")
+    shard.execute(queries['recompute_shard_creation'])
+    params = {"last_id": first_id, "shard_last_id": last_id, "chunk_size": chunk_size}
+    scored = 0
+    try:
+        while True:
+            rows = conn.execute(queries['recompute_inputs'], params).fetchall()
+            if not rows:
+                break
+            shard.executemany(queries['recompute_shard_insertion'], score_rows(rows))
+            scored += len(rows)
+            params['last_id'] = rows[-1][0]
+        shard.commit()
+    finally:
+        conn.close()
+        shard.close()
+    logging.info(F"ranking rows {first_id + 1}-{last_id}: {scored} rows scored into {shard_path}")
+    return scored
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Callable
+
+
+class SearchResultCache():
+    """
+    a bounded LRU cache of search results with a TTL.
+    every entry is tagged with the cache's generation at the time its result was read from the DB, so an entry of an
+    older generation is never served. the generation is bumped by this process' writes that may change search results
+    (invalidate), and, with data_version, by every commit to the DB of any connection or process.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0, data_version: Callable[[], int] = None):
+        """
+        :param max_size: max number of cached results, 0 disables the cache
+        :param ttl: seconds a result is served from the cache
+        :param data_version: returns the DB's data version, which changes whenever a change is committed to the DB
+                             (e.g. ConnectionPool.data_version)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data_version = data_version
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> tuple:
+        """
+        the cache's generation: the count of its invalidations, and the DB's data version
+        """
+        return self._generation, self.data_version() if self.data_version else 0
+
+    def get(self, key: tuple) -> dict:
+        """
+        :param key: the search key
+        :return: a copy of the cached result, None if missing, expired or of an older generation
+        """
+        generation = self.generation
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return deepcopy(entry[2])
+
+    def put(self, key: tuple, result: dict, generation: int):
+        """
+        :param key: the search key
+        :param result: the search result
+        :param generation: the generation read before the result was queried; a result which was queried while a
+                           write committed is not cached
+        """
+        if not self.max_size or generation != self.generation:
+            return
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> int:
+        """
+        drop all cached results
+        :return: the new generation
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+        return self.generation
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "generation": self.generation, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,181 @@
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Iterable, List, Tuple
+
+logging.getLogger()
+
+# file layout (little endian):
+#   header: magic, format version, top_k, keys count, created (unix time)
+#   index:  a (key offset, key length, results offset, results count) entry per key, sorted by key
+#   keys and results: utf-8 keys; a result is its url and unique url, each prefixed by its length
+HEADER = struct.Struct('<8sIIId')
+INDEX_ENTRY = struct.Struct('<QIQI')
+LENGTH = struct.Struct('<H')
+MAGIC = b'SESNAPSH'
+FORMAT_VERSION = 1
+
+
+class SearchSnapshot():
+    """
+    a read-only, memory-mapped file of the top-K search results (url, unique url) per keyword, exported from the DB
+    by export_search_snapshot_job. a lookup is a binary search of the file's index, reading only the pages of the
+    looked up key, with no sqlite connection; the file's pages are shared by all the processes which map it.
+    a lookup maps a newly exported file (checked by its stat, at most once per refresh_interval).
+    """
+
+    def __init__(self, path, refresh_interval: float = 1.0):
+        """
+        :param path: the snapshot file path
+        :param refresh_interval: min seconds between the lookups' checks for a newly exported file, None to map the
+                                 file only on refresh()
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._file = self._mmap = None
+        self._stat = None
+        self._checked = 0.0
+        self.top_k = self.count = 0
+        self.created = None
+        self.refresh()
+
+    @staticmethod
+    def key(search_term: str) -> str:
+        """
+        :param search_term: a keyword or a search term
+        :return: the term's words, lower cased and separated by a single space, as the snapshot is keyed by
+        """
+        return ' '.join(re.findall(r'\w+', search_term.lower()))
+
+    @staticmethod
+    def write(path, entries: Iterable[Tuple[str, List[tuple]]], top_k: int) -> int:
+        """
+        write a snapshot file, atomically replacing a former one (its mapped readers keep reading the former file)
+        :param path: the snapshot file path
+        :param entries: (key, [(url, unique url), ...]) pairs, the results in rank order
+        :param top_k: max number of results per key
+        :return: number of written keys
+        """
+        entries = sorted((key.encode(), results[:top_k]) for key, results in entries)
+        index, blob = [], bytearray()
+        data_offset = HEADER.size + INDEX_ENTRY.size * len(entries)
+        for key, results in entries:
+            key_offset = data_offset + len(blob)
+            blob += key
+            results_offset = data_offset + len(blob)
+            for result in results:
+                for value in result:
+                    value = value.encode()
+                    blob += LENGTH.pack(len(value)) + value
+            index.append(INDEX_ENTRY.pack(key_offset, len(key), results_offset, len(results)))
+        tmp_path = F"{path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, top_k, len(entries), time.time()))
+            file.write(b''.join(index))
+            file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def refresh(self) -> bool:
+        """
+        map the snapshot file again if it was replaced since it was mapped
+        :return: True if a new file was mapped
+        """
+        self._checked = time.monotonic()
+        stat = os.stat(self.path)
+        if self._stat and (stat.st_ino, stat.st_mtime_ns) == (self._stat.st_ino, self._stat.st_mtime_ns):
+            return False
+        file = open(self.path, 'rb')
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, top_k, count, created = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            mapped.close()
+            file.close()
+            raise ValueError(F"{self.path} is not a search snapshot of format version {FORMAT_VERSION}")
+        with self._lock:
+            old_file, old_mapped = self._file, self._mmap
+            self._file, self._mmap, self._stat = file, mapped, stat
+            self.top_k, self.count, self.created = top_k, count, created
+        if old_mapped is not None:
+            old_mapped.close()
+            old_file.close()
+        return True
+
+    def get(self, search_term: str, limit: int = None) -> List[tuple]:
+        """
+        :param search_term: a keyword or a search term
+        :param limit: max number of results, defaults to the snapshot's top_k
+        :return: the term's (url, unique url) results in rank order, None if the term is not in the snapshot, or if
+                 it has more results than the snapshot holds (top_k) and the limit is above top_k
+        """
+        if self.refresh_interval is not None and time.monotonic() - self._checked >= self.refresh_interval:
+            try:
+                self.refresh()
+            except (OSError, ValueError) as err:
+                # the mapped file is served until a valid one is exported
+                logging.info(F"{self.path} is not refreshed: {err}")
+        key = SearchSnapshot.key(search_term).encode()
+        with self._lock:
+            mapped = self._mmap
+            low, high = 0, self.count
+            while low < high:
+                middle = (low + high) // 2
+                key_offset, key_length, results_offset, results_count = \
+                    INDEX_ENTRY.unpack_from(mapped, HEADER.size + middle * INDEX_ENTRY.size)
+                entry_key = mapped[key_offset:key_offset + key_length]
+                if entry_key < key:
+                    low = middle + 1
+                elif entry_key > key:
+                    high = middle
+                else:
+                    if limit and limit > self.top_k and results_count >= self.top_k:
+                        return None
+                    return self._results(mapped, results_offset, min(results_count, limit or results_count))
+        return None
+
+    @staticmethod
+    def _results(mapped: mmap.mmap, offset: int, count: int) -> List[tuple]:
+        results = []
+        for _ in range(count):
+            values = []
+            for _ in range(2):
+                length, = LENGTH.unpack_from(mapped, offset)
+                offset += LENGTH.size
+                values.append(mapped[offset:offset + length].decode())
+                offset += length
+            results.append(tuple(values))
+        return results
+
+    def get_search_term_options(self, search_term: str, limit: int = None) -> dict:
+        """
+        the snapshot's counterpart of SearchWebsiteActivities.get_search_term_options, for search workers which have
+        no DB connection; only the first page (up to top_k options) of keywords' results is served
+        :param search_term: a keyword
+        :param limit: max number of options, defaults to the snapshot's top_k
+        :return: a dict with the matching options, ordered by rank; an error with msg 'Snapshot Miss' if the snapshot
+                 cannot serve the term (e.g. it is not an exported keyword), which the DB search can
+        """
+        results = self.get(search_term, limit)
+        if results is None:
+            return {"status": "error", "data": F"{search_term!r} is not in the search snapshot",
+                    "msg": "Snapshot Miss", "next_cursor": None}
+        if not results:
+            return {"status": "success", "data": [], "msg": "No Data Found", "next_cursor": None}
+        options = [{"option_value": F"option{idx}", "product_page_url": url, "product_unique_url": unique_url}
+                   for idx, (url, unique_url) in enumerate(results, start=1)]
+        return {"status": "success", "data": options, "msg": "Data Found", "next_cursor": None}
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._file.close()
+            self._file = self._mmap = self._stat = None
+            self.count = 0
@@ -1,9 +1,23 @@
 import os
+import re
+import json
+import base64
 import logging
 import secrets
+import sqlite3
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from multiprocessing import get_context
 from importlib.resources import files, read_text
-from clients.db.data_base_client import DataBaseClient
+from typing import Iterable, List
+from clients.db.data_base_client import DataBaseClient, QueryResult
+from clients.db.query_metrics import instrumented_job
+from clients.api.search_cache import SearchResultCache
+from clients.api.product_cache import ProductCatalogCache
+from clients.api.ranking_recompute import score_shard
+from clients.api.search_snapshot import SearchSnapshot
 
 logging.getLogger()
 
@@ -14,7 +28,15 @@ class SearchWebsiteActivities(DataBaseClient):
             setattr(self, key, kwargs[key])
         self.db_path = files(self.db_client_dir).joinpath(self.db_name)
         self.data_jobs_path = files(self.data_jobs_dir).joinpath(self.data_jobs_fn)
-        super().__init__(self.db_path)
+        super().__init__(self.db_path, cached_statements=self.cached_statements, journal_mode=self.journal_mode,
+                         synchronous=self.synchronous, cache_size=self.cache_size, mmap_size=self.mmap_size,
+                         slow_query_threshold=self.slow_query_threshold, max_readers=self.max_readers)
+        # writes of other processes (e.g. a ranking job's) are seen through the DB's data version
+        self.search_cache = SearchResultCache(max_size=self.search_cache_size, ttl=self.search_cache_ttl,
+                                              data_version=self.pool.data_version)
+        self.product_cache = ProductCatalogCache(max_size=self.product_cache_size)
+        self.search_snapshot_path = files(self.db_client_dir).joinpath(self.search_snapshot_fn)
+        self._search_snapshot = None
 
     def delete_db_tables(self, json_dir: str, json_fn: str,
                          force: bool = False) -> object:
@@ -51,9 +73,58 @@ class SearchWebsiteActivities(DataBaseClient):
             self.exec_sql_queries(json_fn=json_fn, json_dir=json_dir, fetch_all=False)
             res = self.count_tables()
             logging.info(F"after table deletion: {res} table/s exist")
+        self.migrate_db_schema()
         logging.info(f'{sys._getframe().f_code.co_name} finished successfully')
         return res
 
+    @instrumented_job
+    def migrate_db_schema(self, target_version: int = None) -> object:
+        """
+        bring the DB schema (indexes and data fixes on top of the tables creation file) to a target version,
+        in place. to upgrade an existing DB, run create_db_tables with force=True; it creates the missing tables
+        and then applies the pending migrations.
+        :param target_version: schema version to migrate to, defaults to the latest one
+        :return: an object with the applied migrations
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        res = self.migrate(self.db_data_dir, self.schema_migrations_fn, target_version=target_version)
+        if res.data:
+            self.search_cache.invalidate()
+        logging.info(F"{sys._getframe().f_code.co_name} finished, schema version: {res.msg}")
+        return res
+
+    def check_query_plans(self) -> dict:
+        """
+        verify with EXPLAIN QUERY PLAN that the search query and the ranking job queries use indexes
+        :return: a dict of query name -> {"plan": [plan steps], "full_scans": [steps which scan a whole table]}
+        """
+        queries = {"search": self.search_query,
+                   "products_by_name": self.products_by_name_query}
+        for name in ('chunk_last_id', 'staging_insertion', 'staging_missing', 'scores_update', 'checkpoint_selection',
+                     'recompute_inputs'):
+            queries[name] = self.ranking_queries[name]
+        for idx, query in enumerate(self.ranking_queries['ranking_insertion']):
+            queries[F"ranking_insertion_{idx}"] = query.format(columns=self.search_engine_ranking_col)
+        params = {**self.search_params('a', 1), "after_score": 1.0, "after_sum": 1, "after_max": 1, "after_id": 1,
+                  "job_name": "", "last_id": 0, "chunk_last_id": 0, "shard_last_id": 0, "chunk_size": 1}
+        with self.pool.write() as conn:
+            for query in self.ranking_queries['staging_creation']:
+                conn.execute(query)
+        output = {}
+        for name, query in queries.items():
+            plan = self.explain_query_plan(query, [json.dumps([])] if name == 'products_by_name' else params)
+            # the staging table and ranking_parameters are read whole by design (see allowed_full_scans setting),
+            # a full-text MATCH is an index search of the virtual table, and subqueries are scanned as they are built
+            subqueries = {step.split(' ', 1)[1] for step in plan if step.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+            full_scans = [step for step in plan if step.startswith('SCAN') and ' USING ' not in step
+                          and ' VIRTUAL TABLE INDEX ' not in step and step[len('SCAN '):] not in subqueries
+                          and step != 'SCAN CONSTANT ROW' and step.split()[1] not in self.allowed_full_scans.split(', ')]
+            output[name] = {"plan": plan, "full_scans": full_scans}
+            if full_scans:
+                logging.info(F"{name} query does not use an index: {full_scans}")
+        return output
+
+    @instrumented_job
     def insert_ranking_parameters(self) -> dict:
         """
         insert ref data into ranking_parameters table using data_base_client.insert_into_table api (function)
@@ -64,11 +135,13 @@ class SearchWebsiteActivities(DataBaseClient):
         logging.info(f'{sys._getframe().f_code.co_name} started')
         output = {"status": "success", "data": f'{self.rank_tn}', "msg": ""}
         if any([self.is_delete_tables, self.is_truncate_tables]):
-            res = self.insert_into_table(self.db_data_dir, self.rank_insert_fn, table_name=self.rank_tn)
+            res = self.insert_into_table(self.db_data_dir, self.rank_insert_fn, table_name=self.rank_tn,
+                                         bulk=self.is_bulk_insert, batch_size=self.insert_batch_size)
             output['msg'] = res['status']
             logging.info(F"{sys._getframe().f_code.co_name} finished, {output['msg']}\n\n")
             return output
 
+    @instrumented_job
     def insert_products_job(self) -> dict:
         """
         insert data (products, keywords) from a file into products table using data_base_client.insert_into_table api (function)
@@ -80,11 +153,50 @@ class SearchWebsiteActivities(DataBaseClient):
         logging.info(f'{sys._getframe().f_code.co_name} started')
         output = {"status": "success", "data": f'{self.products_tn}', "msg": ""}
         if any([self.is_delete_tables, self.is_truncate_tables]):
-            res = self.insert_into_table(self.db_data_dir, self.products_insert_fn, table_name=self.products_tn)
+            res = self.insert_into_table(self.db_data_dir, self.products_insert_fn, table_name=self.products_tn,
+                                         bulk=self.is_bulk_insert, batch_size=self.insert_batch_size)
+            self.product_cache.invalidate()
             output['msg'] = res['status']
             logging.info(F"{sys._getframe().f_code.co_name} finished, {output['msg']}\n\n")
             return output
 
+    @instrumented_job
+    def insert_products_feed_job(self, feed_path=None, fmt: str = None, resume: bool = True) -> object:
+        """
+        stream products from a NDJSON or CSV feed into the products table, a batch per transaction.
+        the byte offset of each committed batch is checkpointed in job_checkpoints, together with the feed file's
+        fingerprint, so a failed load resumes where it stopped, while a rotated or replaced feed is loaded from its
+        start.
+        :param feed_path: path of the feed file, defaults to products_feed_fn in the db_data folder
+        :param fmt: 'ndjson' or 'csv', defaults to the file's extension
+        :param resume: continue from the feed's checkpoint, otherwise load it from its start
+        :return: an object with the number of inserted products
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        feed_path = feed_path or files(self.db_data_dir).joinpath(self.products_feed_fn)
+        params = {"job_name": F"{sys._getframe().f_code.co_name}:{feed_path}",
+                  "fingerprint": self.feed_fingerprint(feed_path)}
+        saved = self.exec_sql_query(self.ranking_queries['feed_checkpoint_selection'], fetch_all=False,
+                                    params=params).data if resume else None
+        start_offset = 0
+        if saved:
+            offset, fingerprint = saved
+            if fingerprint == params['fingerprint'] and self.is_feed_record_end(feed_path, offset):
+                start_offset = offset
+            else:
+                logging.info(F"the checkpoint of {feed_path} refers to another file, it is loaded from its start")
+
+        def checkpoint(conn, offset):
+            self.execute(conn, self.ranking_queries['feed_checkpoint_update'], {**params, "offset": offset})
+
+        res = self.load_feed(feed_path, self.products_tn, columns=self.products_feed_columns, fmt=fmt,
+                             batch_size=self.insert_batch_size, start_offset=start_offset, on_batch=checkpoint,
+                             raise_error=False)
+        self.product_cache.invalidate()
+        logging.info(F"{sys._getframe().f_code.co_name} finished, {res.status}, {res.msg}")
+        return res
+
+    @instrumented_job
     def insert_new_site_into_search_engine_api(self, url: str, product: str, keywords: dict, seniority: int,
                                                ref: int = 0) -> str:
         """
@@ -96,107 +208,382 @@ class SearchWebsiteActivities(DataBaseClient):
         :return: website's unique url
         """
         logging.info(f'{sys._getframe().f_code.co_name} job started')
-        if not all([url, product, keywords, seniority]):
-            logging.info(f'{sys._getframe().f_code.co_name} existing on starting - missing all api input - no tables '
-                         f'update made')
-            return
-        token = secrets.token_urlsafe()
-        unique_url = F"{url}/{token}"
-        query = F"insert into websites (url) values ('{url}');"
-        self.exec_sql_query(query, fetch_all=False, commit=True)
-        query = F"select max(id) from websites;"
-        res = self.exec_sql_query(query, fetch_all=False)
-        website_id = res.data
-        query = F"select products.id, keywords from products where name = '{product}';"
-        res = self.exec_sql_query(query, fetch_all=False)
-        if res.data:
-            keywords_set = set(
-                value.lower() for key, value in keywords.items())  # to overcome case sensitivity differences
-            product_id, keywords_selected_str, = res.data
-            keywords_selected_str = keywords_selected_str.rstrip(',')
-            keywords_selected_set = set(i.lower().strip() for i in keywords_selected_str.split(','))
-            if keywords_set == keywords_selected_set:  # set comparison to eliminate duplicity differences
-                query = F"insert into websites_products (website_id, product_id, ref, unique_url) values ({website_id}, {product_id}, {ref}, '{unique_url}');"
-                self.exec_sql_query(query, fetch_all=False, commit=True)
-                query = F"select max(id) from websites_products;"
-                res = self.exec_sql_query(query, fetch_all=False)
-                websites_products_id = res.data
-                with open(self.data_jobs_path, "a+") as tmp_rank_fn:
-                    tmp_rank_fn.write(f'{websites_products_id} {seniority}\n')
+        site = {"url": url, "product": product, "keywords": keywords, "seniority": seniority, "ref": ref}
+        unique_url, = self.insert_new_sites([site])
         logging.info(f'{sys._getframe().f_code.co_name} job finished')
         return unique_url
 
-    def update_ranking_job(self) -> object:
+    @instrumented_job
+    def insert_new_sites(self, sites: Iterable[dict]) -> List[str]:
+        """
+        insert a batch of new websites to DB within a single transaction.
+        a website is linked to its product (and queued in ranking_job_queue for the ranking job) only if the product
+        exists and its keywords match the website's keywords.
+        :param sites: website records; dicts with the insert_new_site_into_search_engine_api arguments as keys
+                      (url, product, keywords, seniority and optionally ref)
+        :return: websites' unique urls, in the order of the given records (None for a record with missing input)
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        sites = list(sites)
+        required_keys = ('url', 'product', 'keywords', 'seniority')
+        products = self.product_cache.get_many({site['product'] for site in sites
+                                                if all(site.get(key) for key in required_keys)},
+                                               loader=self.get_products_by_name)
+        unique_urls, jobs = [], []
+        with self.pool.write() as conn:
+            for site in sites:
+                if not all(site.get(key) for key in required_keys):
+                    logging.info(f"{site.get('url')} - missing all api input - no tables update made")
+                    unique_urls.append(None)
+                    continue
+                unique_url = F"{site['url']}/{secrets.token_urlsafe()}"
+                website_id = self.execute(conn, "insert into websites (url) values (?);", (site['url'],)).lastrowid
+                # to overcome case sensitivity differences
+                keywords_set = set(value.lower() for value in site['keywords'].values())
+                product_id, keywords_selected_set = products.get(site['product'], (None, None))
+                if keywords_set == keywords_selected_set:  # set comparison to eliminate duplicity differences
+                    query = "insert into websites_products (website_id, product_id, ref, unique_url) values (?, ?, ?, ?);"
+                    cur = self.execute(conn, query, (website_id, product_id, site.get('ref', 0), unique_url))
+                    jobs.append((cur.lastrowid, site['seniority']))
+                unique_urls.append(unique_url)
+            # queue the linked websites for update_ranking_job
+            self.execute(conn, self.ranking_queries['queue_insertion'], jobs, many=True)
+        if jobs:
+            self.search_cache.invalidate()
+        logging.info(f'{sys._getframe().f_code.co_name} finished, {len(sites)} sites, {len(jobs)} linked to products')
+        return unique_urls
+
+    # the names are bound as a single json array, so the same prepared statement serves any number of names
+    products_by_name_query = "select name, id, keywords from products where name in (select value from json_each(?)) " \
+                             "order by id;"
+
+    def get_products_by_name(self, names: Iterable[str]) -> dict:
+        """
+        look up products by name; when several products share a name the first inserted one is taken
+        :param names: product names
+        :return: a dict of product name -> (product id, frozenset of normalized keywords)
+        """
+        products = {}
+        with self.pool.read() as conn:
+            rows = self.execute(conn, self.products_by_name_query, (json.dumps(list(names)),)).fetchall()
+        for name, product_id, keywords in rows:
+            keywords = (keywords or '').rstrip(',')
+            products.setdefault(name, (product_id, frozenset(i.lower().strip() for i in keywords.split(','))))
+        return products
+
+    @cached_property
+    def ranking_queries(self) -> dict:
+        """
+        the ranking job queue and scoring queries, loaded once from the db_data folder
+        :return: a dict of query name -> query (or a list of queries)
+        """
+        return self.load_json(files(self.db_data_dir).joinpath(self.ranking_queries_fn))
+
+    def enqueue_legacy_jobs_file(self) -> int:
+        """
+        move websites which are pending in a jobs file (written by former versions) into ranking_job_queue
+        :return: the number of queued websites
+        """
+        if not os.path.exists(self.data_jobs_path):
+            return 0
+        with open(self.data_jobs_path, 'r') as rank_file:
+            pending = [line.split() for line in rank_file if line.strip()]
+        with self.pool.write() as conn:
+            self.execute(conn, self.ranking_queries['queue_insertion'], pending, many=True)
+        os.unlink(self.data_jobs_path)
+        logging.info(F"{len(pending)} pending websites moved from {self.data_jobs_path} into ranking_job_queue")
+        return len(pending)
+
+    @instrumented_job
+    def update_ranking_job(self, chunk_size: int = None) -> object:
         """
         update the ranking table with the inserted websites and calculates the parameters value
-        for each parameter (references, keywords and seniority)
+        for each parameter (references, keywords and seniority).
+        the websites queued in ranking_job_queue after the job's checkpoint are drained in chunks; each chunk is
+        staged in a temp table, scored in sql against ranking_parameters, aggregated into website_scores and
+        checkpointed (and deleted from the queue) within a single transaction. ranking rows are upserted, so ranking
+        a queued website again does not duplicate them.
+        :param chunk_size: max number of queued websites per transaction, defaults to ranking_job_chunk_size
         :return: an object with success or error status
         """
         logging.info(f'{sys._getframe().f_code.co_name} started')
-        if os.path.exists(self.data_jobs_path):
-            query = "select * from ranking_parameters;"
-            res = self.exec_sql_query(query)
-            # getting reference data from ranking_parameters table ans set it as sef attributes
-            for row in res.data:
-                setattr(self, F"r_{row[1]}_id", row[0])  # parameter_id field
-                setattr(self, F"r_{row[1]}_priority", row[2])  # parameter priority
-                setattr(self, F"r_{row[1]}_grade", row[3])  # parameter_grade field
-            with open(self.data_jobs_path, 'r') as rank_file:
-                lines = rank_file.readlines()
-            for line in lines:
-                line = line.strip('\n')
-                ls_1 = line.split(' ')
-                # insert seniority vals into search_engine_ranking table
-                website_products_id, seniority = ls_1
-                query = F"""insert into search_engine_ranking 
-                ({self.search_engine_ranking_col}) values ({website_products_id}, {self.r_seniority_id}, 
-                {self.r_seniority_grade * int(seniority)}, {self.r_seniority_grade});"""
-                res = self.exec_sql_query(query, fetch_all=False)
-                # getting other elements values; keywords, ref
-                query = F"""select keywords, ref from websites_products as wp join products as p 
-                            on wp.product_id = p.id where wp.id = {website_products_id};"""
-                res = self.exec_sql_query(query, fetch_all=False)
-                if res.data is None:
-                    logging.info(F"cannot find website_products_id = {website_products_id} in {self.data_jobs_path}"
-                                 F"it is not inserted into search_engine_ranking table")
-                    continue
-                website_product_rel_id = website_products_id
-                keywords, ref = res.data
-                keywords = keywords.rstrip(',')
-                keywords_num = len(keywords.split(','))
-                query = F"""insert into search_engine_ranking ({self.search_engine_ranking_col})
-                        values('{website_product_rel_id}','{self.r_ref_id}', {self.r_ref_grade * ref}, 
-                                                                                            {self.r_ref_grade})"""
-                res = self.exec_sql_query(query)
-                query = F"""insert into search_engine_ranking ({self.search_engine_ranking_col})
-                        values('{website_product_rel_id}','{self.r_keywords_id}',
-                                        {self.r_keywords_grade * keywords_num}, {self.r_keywords_grade})"""
-                res = self.exec_sql_query(query)
+        queries = self.ranking_queries
+        self.enqueue_legacy_jobs_file()
+        params = {"job_name": sys._getframe().f_code.co_name, "chunk_size": chunk_size or self.ranking_job_chunk_size}
+        processed = 0
+        while True:
+            with self.pool.write() as conn:
+                params['last_id'], = self.execute(conn, queries['checkpoint_selection'], params).fetchone()
+                params['chunk_last_id'], = self.execute(conn, queries['chunk_last_id'], params).fetchone()
+                if params['chunk_last_id'] is None:
+                    break
+                for query in queries['staging_creation']:
+                    self.execute(conn, query)
+                processed += self.execute(conn, queries['staging_insertion'], params).rowcount
+                missing = [row[0] for row in self.execute(conn, queries['staging_missing'])]
+                if missing:
+                    logging.info(F"cannot find website_products_id/s = {missing} of ranking_job_queue, "
+                                 F"they are not inserted into search_engine_ranking table")
+                for query in queries['ranking_insertion']:
+                    self.execute(conn, query.format(columns=self.search_engine_ranking_col))
+                self.execute(conn, queries['scores_update'])
+                self.execute(conn, queries['checkpoint_update'], params)
+                # the checkpointed websites are not read again
+                self.execute(conn, queries['queue_deletion'], params)
+        if processed:
+            self.search_cache.invalidate()
+            message = "update_ranking_job succeeded"
+            logging.info(F"update ranking - {processed} queued websites processed")
+            if self.is_export_search_snapshot:
+                self.export_search_snapshot_job()
         else:
             logging.info('update ranking - found no new websites to update')
             message = 'No Data Found'
-        message = message if locals().get('message') else "update_ranking_job succeeded"
         logging.info(message)
         return {"status": "success", "data": [], "msg": message}
 
-    def get_search_term_options(self, search_term):
+    @instrumented_job
+    def rebuild_website_scores(self) -> object:
+        """
+        recompute the website_scores table (the per website aggregation of search_engine_ranking which the search
+        is ordered by) from scratch
+        :return: an object with the number of scored websites
+        """
         logging.info(f'{sys._getframe().f_code.co_name} started')
-        query_url = read_text(self.db_data_dir, self.search_query_fn)
+        with self.pool.write() as conn:
+            for query in self.ranking_queries['scores_rebuild']:
+                cur = self.execute(conn, query)
+        self.search_cache.invalidate()
+        logging.info(F"{sys._getframe().f_code.co_name} finished, {cur.rowcount} websites scored")
+        return QueryResult("success", cur.rowcount)
+
+    @instrumented_job
+    def recompute_ranking_job(self, processes: int = None, chunk_size: int = None) -> dict:
+        """
+        recompute every search_engine_ranking value by the current ranking_parameters grades (e.g. after a
+        grade_per_unit change), from the raw units (seniority, references, keywords count) kept with each value.
+        the ranking rows are split into id ranges, which are scored by a pool of processes (vectorized with numpy,
+        when it is installed), each into a shard DB file. the shards are merged into a new table, which replaces
+        search_engine_ranking together with a rebuilt website_scores. the whole job is a single transaction, which
+        holds the DB write lock from the ranking rows' range read to the swap: readers see either the former or the
+        recomputed scores, and other writes (of any process) wait for the recompute to end.
+        :param processes: number of scoring processes, defaults to ranking_recompute_processes (0 - a process per cpu)
+        :param chunk_size: ranking rows read and scored at a time, defaults to ranking_recompute_chunk_size
+        :return: an object with success or error status, and the number of recomputed rows
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        queries = self.ranking_queries
+        processes = processes or self.ranking_recompute_processes or os.cpu_count()
+        chunk_size = chunk_size or self.ranking_recompute_chunk_size
+        # the DB write lock is held from the range read to the swap, so no process (nor thread) writes ranking rows
+        # which the recompute would miss or drop; the scoring processes read the committed rows meanwhile
+        with self.pool.write(immediate=True) as conn:
+            first_id, last_id = self.execute(conn, queries['recompute_id_range']).fetchone()
+            if first_id is None:
+                logging.info('recompute ranking - found no ranking rows')
+                return {"status": "success", "data": 0, "msg": "No Data Found"}
+            # id ranges of about the same size, (bounds[idx], bounds[idx + 1]] per shard
+            processes = max(1, min(processes, (last_id - first_id) // chunk_size + 1))
+            bounds = [first_id - 1 + (last_id - first_id + 1) * idx // processes for idx in range(processes + 1)]
+            with tempfile.TemporaryDirectory(prefix='ranking_recompute_') as shards_dir:
+                shards = [(str(self.db_path), os.path.join(shards_dir, F"shard{idx}.db"), queries, bounds[idx],
+                           bounds[idx + 1], chunk_size) for idx in range(processes)]
+                if processes == 1:
+                    scored = [score_shard(*shards[0])]
+                else:
+                    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn')) as executor:
+                        scored = list(executor.map(score_shard, *zip(*shards)))
+                self.execute(conn, queries['recompute_table_deletion'])
+                table_sql, = self.execute(conn, queries['recompute_table_sql']).fetchone()
+                self.execute(conn, table_sql.replace('search_engine_ranking', 'search_engine_ranking_rebuild', 1))
+                # rows which cannot be scored (no raw units, or a parameter without a grade) are kept as they are
+                self.execute(conn, queries['recompute_unscored'])
+                # a DB cannot be attached within a transaction, so the shards are copied in chunks
+                for _, shard_path, *_ in shards:
+                    shard = sqlite3.connect(shard_path)
+                    try:
+                        shard_rows = shard.execute(queries['recompute_shard_rows'])
+                        while rows := shard_rows.fetchmany(chunk_size):
+                            self.execute(conn, queries['recompute_merge'], rows, many=True)
+                    finally:
+                        shard.close()
+            index_sql = [row[0] for row in self.execute(conn, queries['recompute_index_sql'])]
+            seq, = self.execute(conn, queries['recompute_sequence']).fetchone()
+            for query in queries['recompute_swap']:
+                self.execute(conn, query)
+            for query in index_sql:
+                self.execute(conn, query)
+            self.execute(conn, queries['recompute_sequence_update'], {"seq": seq})
+            for query in queries['scores_rebuild']:
+                self.execute(conn, query)
+        self.search_cache.invalidate()
+        logging.info(F"{sys._getframe().f_code.co_name} finished, {sum(scored)} ranking rows recomputed by "
+                     F"{processes} process/es")
+        return {"status": "success", "data": sum(scored), "msg": "recompute_ranking_job succeeded"}
+
+    @instrumented_job
+    def export_search_snapshot_job(self, top_k: int = None) -> dict:
+        """
+        export the top-K search results of every keyword (of product_keywords), in the search query's order, into the
+        search snapshot file, which get_search_term_options serves in 'snapshot' mode
+        :param top_k: max number of results per keyword, defaults to search_snapshot_top_k
+        :return: an object with success or error status, and the number of exported keywords
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        top_k = top_k or self.search_snapshot_top_k
+        entries = {}
+        for keyword, in self.iter_query("SELECT DISTINCT keyword FROM product_keywords;"):
+            key = SearchSnapshot.key(keyword)
+            if not key or key in entries:
+                continue
+            with self.pool.read() as conn:
+                rows = self.execute(conn, self.search_query, self.search_params(key, top_k)).fetchall()
+            if rows:
+                entries[key] = [row[:2] for row in rows]
+        exported = SearchSnapshot.write(self.search_snapshot_path, entries.items(), top_k)
+        if self._search_snapshot is not None:
+            self._search_snapshot.refresh()
+        logging.info(F"{sys._getframe().f_code.co_name} finished, {exported} keywords exported into "
+                     F"{self.search_snapshot_path}")
+        return {"status": "success", "data": exported, "msg": "export_search_snapshot_job succeeded"}
+
+    @property
+    def search_snapshot(self) -> SearchSnapshot:
+        """
+        the search snapshot file reader, mapped on first use
+        """
+        if self._search_snapshot is None:
+            self._search_snapshot = SearchSnapshot(self.search_snapshot_path,
+                                                   refresh_interval=self.search_snapshot_refresh_interval)
+        return self._search_snapshot
+
+    @cached_property
+    def search_query(self) -> str:
+        """
+        the search query, read once from the db_data folder
+        """
+        return read_text(self.db_data_dir, self.search_query_fn)
+
+    @staticmethod
+    def fts_match_query(search_term: str) -> str:
+        """
+        build the products_fts MATCH expression of a free-text search term
+        :param search_term: free text, e.g. "leisure tim"
+        :return: the expression, matching products which have all the words (the last one as a prefix) in their
+                 name, description or keywords, e.g. '"leisure" "tim"*'; empty if the term has no words
+        """
+        words = re.findall(r'\w+', search_term.lower())
+        return ' '.join(F'"{word}"' for word in words) + '*' if words else ''
+
+    def search_params(self, search_term: str, limit: int) -> dict:
+        """
+        :param search_term: free text to search for
+        :param limit: page size
+        :return: the search query params of the term's first page
+        """
+        name_weight, description_weight, keywords_weight = map(float, self.search_bm25_weights.split(','))
+        return {"search_term": self.fts_match_query(search_term), "limit": limit,
+                "rank_weight": float(self.search_rank_weight), "text_weight": float(self.search_text_weight),
+                "rank_scale": float(self.search_rank_scale), "text_scale": float(self.search_text_scale),
+                "name_weight": name_weight, "description_weight": description_weight,
+                "keywords_weight": keywords_weight,
+                "after_score": None, "after_sum": None, "after_max": None, "after_id": None}
+
+    @staticmethod
+    def encode_cursor(position: int, rows: List[tuple]) -> str:
+        """
+        :param position: the option number of the page's last option
+        :param rows: the page's option rows of the search query (their score, SumVal, MaxGradeAndValue and id last)
+        :return: an opaque continuation cursor to the next page, after the page's last option
+        """
+        last = min(row[-4:] for row in rows)
+        return base64.urlsafe_b64encode(json.dumps([position, *last]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> dict:
+        """
+        :param cursor: a continuation cursor, as returned by encode_cursor
+        :return: the position and the search query params of the page after the cursor
+        """
+        position, score, sum_val, max_grade_and_value, rel_id = json.loads(base64.urlsafe_b64decode(cursor))
+        if not all(isinstance(value, (int, float)) for value in (score, sum_val, max_grade_and_value)):
+            raise ValueError(F"not a search cursor: {cursor}")
+        return {"position": int(position), "after_score": score, "after_sum": sum_val,
+                "after_max": max_grade_and_value, "after_id": int(rel_id)}
+
+    @instrumented_job
+    def get_search_term_options(self, search_term: str, limit: int = None, cursor: str = None,
+                                mode: str = None) -> dict:
+        """
+        full-text search for the highest scored websites whose product matches the given free text, a page at a time.
+        a website's score blends its stored rank (SumVal) and the bm25 relevance of its product, each scaled to 0-1
+        by a constant (search_rank_scale, search_text_scale) and weighted by search_rank_weight and
+        search_text_weight, so a website scores the same on every page. the cursor is keyed on the score and the
+        stored rank (SumVal, MaxGradeAndValue and id) of the page's last website, so the websites which are ranked
+        while paging do not shift the next pages.
+        results are served from the search cache until a ranking or ingestion write invalidates it.
+        in 'snapshot' mode, keywords' first page is served from the search snapshot file (as of its last export);
+        the terms which the snapshot cannot serve (not exported keywords, or a limit above its top_k), and the pages
+        after a cursor, are searched in the DB.
+        :param search_term: free text to search for (case insensitive)
+        :param limit: page size, a positive integer, defaults to search_results_limit (at most search_max_page_size)
+        :param cursor: the next_cursor of the former page, None for the first page
+        :param mode: 'db' or 'snapshot', defaults to search_mode
+        :return: a dict with the page's options, ordered by rank, and the next page's cursor (None on the last page)
+        """
+        logging.info(f'{sys._getframe().f_code.co_name} started')
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+            logging.info(F"{sys._getframe().f_code.co_name} finished, invalid limit: {limit}")
+            return {"status": "error", "data": F"error msg: limit must be a positive integer, got {limit!r}",
+                    "msg": "Invalid Limit", "next_cursor": None}
+        limit = min(limit or self.search_results_limit, self.search_max_page_size)
+        if (mode or self.search_mode) == 'snapshot' and not cursor:
+            try:
+                res_dict = self.search_snapshot.get_search_term_options(search_term, limit)
+            except (OSError, ValueError) as err:
+                res_dict = {"status": "error", "data": F"error msg: {err}", "msg": "Snapshot Unavailable",
+                            "next_cursor": None}
+            if res_dict['msg'] != 'Snapshot Miss':
+                logging.info(F"{sys._getframe().f_code.co_name} finished, served from snapshot, "
+                             F"msg: {res_dict['msg']}")
+                return res_dict
+            logging.info(F"{search_term} is not in the search snapshot, it is searched in the DB")
+        params = self.search_params(search_term, limit)
+        position = 0
+        if cursor:
+            try:
+                after = self.decode_cursor(cursor)
+            except (ValueError, TypeError) as err:
+                logging.info(F"{sys._getframe().f_code.co_name} finished, invalid cursor: {cursor}")
+                return {"status": "error", "data": F"error msg: {err}", "msg": "Invalid Cursor", "next_cursor": None}
+            position = after.pop('position')
+            params.update(after)
+        if not params['search_term']:
+            return {"status": "success", "data": [], "msg": "No Data Found", "next_cursor": None}
+        cache_key = (params['search_term'], limit, cursor)
+        res_dict = self.search_cache.get(cache_key)
+        if res_dict is not None:
+            logging.info(F"{sys._getframe().f_code.co_name} finished, served from cache, msg: {res_dict['msg']}")
+            return res_dict
+        generation = self.search_cache.generation
         # a special case of a response parsing which refers to this function only, therefore not in data_base_client
-        res = self.exec_sql_query(query_url, fetch_all=True, raise_error=False)
-        if res.data:
-            if res.status == 'error':
-                res_dict = {"status": "error", "data": F"error msg: {res.msg}\n, {res.data}",
-                            "msg": "Server Unavailable"}
-            else:
-                res_dict = {"status": "success", "data": []}
-                for idx, i in enumerate(res.data, start=1):
-                    val1, val2 = i
-                    res_dict['data'].append(
-                        {"option_value": F"option{idx}", "product_page_url": val1, "product_unique_url": val2})
-                    res_dict['msg'] = 'Data Found'
+        res = self.exec_sql_query(self.search_query, fetch_all=True, raise_error=False, params=params, read_only=True)
+        if res.status == 'error':
+            res_dict = {"status": "error", "data": F"error msg: {res.msg}\n, {res.data}",
+                        "msg": "Server Unavailable", "next_cursor": None}
+        elif res.data:
+            res_dict = {"status": "success", "data": [], "msg": "Data Found", "next_cursor": None}
+            for idx, i in enumerate(res.data, start=position + 1):
+                val1, val2 = i[:2]
+                res_dict['data'].append(
+                    {"option_value": F"option{idx}", "product_page_url": val1, "product_unique_url": val2})
+            # the query tells whether there is a next page (it reads one candidate more than the page size)
+            if res.data[0][2]:
+                res_dict['next_cursor'] = self.encode_cursor(position + limit, res.data)
         else:
-            res_dict = {"status": "success", "data": [], "msg": "No Data Found"}
+            res_dict = {"status": "success", "data": [], "msg": "No Data Found", "next_cursor": None}
+        if res_dict['status'] == 'success':
+            self.search_cache.put(cache_key, res_dict, generation)
         logging.info(F"{sys._getframe().f_code.co_name} finished, status: {res_dict['status']}, msg: {res_dict['msg']}")
         return res_dict
 
@@ -224,8 +611,40 @@ class SearchWebsiteActivities(DataBaseClient):
             return False
         return True
 
+    def truncate_tables(self, table_list: List[str], raise_error=True) -> object:
+        """
+        truncate tables and drop the cached products and search results
+        :param raise_error: raise an error if occurs
+        :param table_list: tables to be truncated
+        :return: an object with the query result
+        """
+        res = super().truncate_tables(table_list, raise_error=raise_error)
+        self.product_cache.invalidate()
+        self.search_cache.invalidate()
+        return res
+
+    def restore(self, template):
+        """
+        overwrite the DB with a snapshot and drop the cached products and search results
+        :param template: a connection to a DB, as returned by snapshot
+        """
+        super().restore(template)
+        self.product_cache.invalidate()
+        self.search_cache.invalidate()
+
+    def close(self):
+        """
+        close all DB connections of the client, and unmap the search snapshot
+        """
+        if self._search_snapshot is not None:
+            self._search_snapshot.close()
+        super().close()
+
+    @instrumented_job
     def tear_down(self):
         logging.info(f'{sys._getframe().f_code.co_name} started')
+        self.search_cache.invalidate()
+        self.product_cache.invalidate()
         output = {"status": "success", "data": f'{self.data_jobs_path}',
                   "msg": {"delete_update_rank_file": F"file deleted successfully", "db_tables": []}}
         if self.is_delete_updating_ranking_file:
@@ -242,6 +661,7 @@ class SearchWebsiteActivities(DataBaseClient):
         elif self.is_truncate_tables:
             deleted_tables_list = self.tables_list.split(',')
             self.truncate_tables(deleted_tables_list)
+            self.migrate_db_schema()
             output['msg']['db_tables'].append('tables truncated successfully')
         logging.info(F"{sys._getframe().f_code.co_name} finished, {output['msg']}\n\n")
         return output
@@ -0,0 +1,193 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logging.getLogger()
+
+
+class ConnectionPool():
+    """
+    sqlite connections of a single DB: a serialized writer connection, shared by all threads under a lock,
+    and a bounded pool of read connections, which a thread checks out for a read block and returns after it.
+    in WAL journal mode the readers run concurrently with each other and with the writer; otherwise (e.g. an
+    in-memory DB) reads are served by the writer connection, under its lock.
+    """
+
+    def __init__(self, db_name, cached_statements: int = 128, journal_mode: str = 'wal',
+                 synchronous: str = 'normal', cache_size: int = -2000, mmap_size: int = 0, busy_timeout: float = 5.0,
+                 max_readers: int = 8):
+        """
+        :param db_name: database name (path)
+        :param cached_statements: number of prepared statements each connection keeps for reuse
+        :param journal_mode: sqlite journal_mode pragma, 'wal' allows concurrent readers
+        :param synchronous: sqlite synchronous pragma ('normal' is durable enough in WAL mode)
+        :param cache_size: sqlite cache_size pragma per connection (negative values are in KiB)
+        :param mmap_size: sqlite mmap_size pragma in bytes (0 disables memory mapped I/O)
+        :param busy_timeout: seconds a connection waits for a lock held by another process
+        :param max_readers: max number of read connections; more concurrent readers wait for a connection
+        """
+        self.db_name = db_name
+        self.cached_statements = cached_statements
+        self.pragmas = {"synchronous": synchronous, "cache_size": int(cache_size), "mmap_size": int(mmap_size)}
+        self.busy_timeout = busy_timeout
+        self.write_lock = threading.RLock()
+        self.max_readers = max_readers
+        # all the opened read connections, the idle ones (reused most recent first), their cursors, and the
+        # connection checked out by each reading thread, with the depth of its nested read blocks
+        self._readers = []
+        self._idle_readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(max_readers)
+        self._cursors = {}
+        self._checkouts = {}
+        self._readers_lock = threading.Lock()
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        self._write_depth = 0
+        # a QueryMetrics which records the write transactions, if set
+        self.metrics = None
+        self.writer = self._connect()
+        self.journal_mode = self.writer.execute(F"PRAGMA journal_mode = {journal_mode};").fetchone()[0]
+        self.writer_cursor = self.writer.cursor()
+        self.concurrent_reads = self.journal_mode == 'wal'
+        logging.info(F"connection pool for {db_name}: journal_mode={self.journal_mode}, {self.pragmas}")
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        open a connection and apply the pool's pragmas
+        :param read_only: reject writes on this connection
+        :return: a connection object
+        """
+        try:
+            conn = sqlite3.connect(self.db_name, cached_statements=self.cached_statements,
+                                   timeout=self.busy_timeout, check_same_thread=False)
+        except Exception as e:
+            logging.info(f'failed to create a connection to db_name: {self.db_name}, Error: {e}')
+            raise ConnectionError(e)
+        for pragma, value in self.pragmas.items():
+            conn.execute(F"PRAGMA {pragma} = {value};")
+        if read_only:
+            conn.execute("PRAGMA query_only = 1;")
+        return conn
+
+    @contextmanager
+    def write(self, commit: bool = True, immediate: bool = False):
+        """
+        serialize a write transaction on the writer connection; nested calls join the outermost transaction
+        :param commit: commit when the outermost block exits (otherwise the transaction is left open)
+        :param immediate: take the DB write lock when the transaction begins (BEGIN IMMEDIATE), rather than on its
+                          first write, so other processes' writes wait for the whole transaction
+        :return: the writer connection
+        """
+        with self.write_lock:
+            outermost = self._write_depth == 0
+            self._write_depth += 1
+            start = time.perf_counter()
+            try:
+                if outermost and not self.writer.in_transaction:
+                    self.writer.execute("BEGIN IMMEDIATE;" if immediate else "BEGIN;")
+                yield self.writer
+                if outermost and commit:
+                    commit_start = time.perf_counter()
+                    self.writer.commit()
+                    if self.metrics:
+                        self.metrics.record({"type": "transaction", "query": "", "commit_seconds":
+                                             time.perf_counter() - commit_start,
+                                             "seconds": time.perf_counter() - start})
+            except BaseException:
+                if outermost:
+                    self.writer.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+
+    @contextmanager
+    def read(self):
+        """
+        get a connection for reads; in WAL mode a read connection checked out of the pool for the block (nested
+        blocks of a thread share its connection), otherwise the writer
+        :return: a connection object
+        """
+        if not self.concurrent_reads:
+            with self.write_lock:
+                yield self.writer
+            return
+        thread_id = threading.get_ident()
+        with self._readers_lock:
+            checkout = self._checkouts.get(thread_id)
+            if checkout:
+                checkout[1] += 1
+        if checkout is None:
+            checkout = [self._checkout(), 1]
+            with self._readers_lock:
+                self._checkouts[thread_id] = checkout
+        try:
+            yield checkout[0]
+        finally:
+            with self._readers_lock:
+                checkout[1] -= 1
+                returned = checkout[1] == 0
+                if returned:
+                    del self._checkouts[thread_id]
+            if returned:
+                self._checkin(checkout[0])
+
+    def _checkout(self) -> sqlite3.Connection:
+        """
+        :return: an idle read connection, or a new one; waits while max_readers connections are checked out
+        """
+        self._reader_slots.acquire()
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self._connect(read_only=True)
+        except BaseException:
+            self._reader_slots.release()
+            raise
+        with self._readers_lock:
+            self._readers.append(conn)
+            self._cursors[conn] = conn.cursor()
+        return conn
+
+    def _checkin(self, conn: sqlite3.Connection):
+        """
+        :param conn: a checked out read connection, returned to the idle ones
+        """
+        self._idle_readers.put(conn)
+        self._reader_slots.release()
+
+    def cursor(self, conn: sqlite3.Connection) -> sqlite3.Cursor:
+        """
+        :param conn: a connection of the pool, as yielded by read or write
+        :return: a cursor which is reused by the connection's (single) owner
+        """
+        if conn is self.writer:
+            return self.writer_cursor
+        return self._cursors[conn]
+
+    def data_version(self) -> int:
+        """
+        the DB's data version, read on a connection of its own, which never writes: as every commit is another
+        connection's to it, the version changes whenever a change is committed to the DB, by any connection of
+        any process
+        :return: sqlite's data_version pragma
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = self._connect(read_only=True)
+            return self._version_conn.execute("PRAGMA data_version;").fetchone()[0]
+
+    def close(self):
+        with self.write_lock:
+            with self._readers_lock:
+                for conn in self._readers + [self.writer]:
+                    conn.close()
+                self._readers = []
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
@@ -1,33 +1,96 @@
+import csv
+import hashlib
 import json
 import logging
+import os
+import re
 import sqlite3
+import time
 from importlib.resources import files
-from typing import List
-from munch import DefaultMunch
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List
 from dataclasses import dataclass
+from clients.db.connection_pool import ConnectionPool
+from clients.db.query_metrics import QueryMetrics
 
 logging.getLogger()
 
 
 class DataBaseClient():
-    def __init__(self, db_name):
-        self.conn = DataBaseClient._create_connection(db_name)
-        self.return_query_msg = ReturnQueryMsg(self.conn)
-
-    @classmethod
-    def _create_connection(cls, db_name) -> object:
-        """ create a database connection to the SQLite database
-            specified by db_file
+    def __init__(self, db_name, cached_statements: int = 128, journal_mode: str = 'wal', synchronous: str = 'normal',
+                 cache_size: int = -2000, mmap_size: int = 0, slow_query_threshold: float = 0.5,
+                 max_readers: int = 8):
+        """
         :param db_name: database name
-        :return: a connection object
+        :param cached_statements: number of prepared statements each connection keeps for reuse
+        :param journal_mode: sqlite journal_mode pragma, 'wal' allows reads concurrent to the (serialized) writes
+        :param synchronous: sqlite synchronous pragma
+        :param cache_size: sqlite cache_size pragma per connection (negative values are in KiB)
+        :param mmap_size: sqlite mmap_size pragma in bytes
+        :param slow_query_threshold: seconds above which a query is logged as slow, with its query plan
+        :param max_readers: max number of read connections, shared by the reading threads
+        """
+        self.metrics = QueryMetrics(slow_query_threshold=slow_query_threshold)
+        self.pool = ConnectionPool(db_name, cached_statements=cached_statements, journal_mode=journal_mode,
+                                   synchronous=synchronous, cache_size=cache_size, mmap_size=mmap_size,
+                                   max_readers=max_readers)
+        self.pool.metrics = self.metrics
+        # the writer connection; writes should go through self.pool.write() to be serialized between threads
+        self.conn = self.pool.writer
+        self.return_query_msg = ReturnQueryMsg(self.pool, self.metrics)
+
+    def execute(self, conn: sqlite3.Connection, query: str, params: object = None,
+                many: bool = False) -> sqlite3.Cursor:
         """
-        conn = None
+        execute a query on a connection of the pool (within a read or write block), recording it in self.metrics
+        :param conn: a connection, as yielded by self.pool.read() or self.pool.write()
+        :param query: a single query
+        :param params: values to be bound to the query's placeholders, or a sequence of them when many
+        :param many: execute the query once per params item (executemany), recorded as a single statement event
+        :return: the query's cursor
+        """
+        start = time.perf_counter()
+        event = {"type": "statement", "query": query}
         try:
-            conn = sqlite3.connect(db_name)
-        except Exception as e:
-            logging.info(f'failed to create a connection to db_name: {db_name}, Error: {e}')
-            raise ConnectionError(e)
-        return conn
+            cur = conn.executemany(query, params) if many else conn.execute(query, params or ())
+            event['rows'] = max(cur.rowcount, 0)
+            return cur
+        except sqlite3.DatabaseError as err:
+            event['error'] = str(err)
+            raise
+        finally:
+            event['seconds'] = time.perf_counter() - start
+            if self.metrics.is_slow(event['seconds']) and 'error' not in event and not many:
+                event['plan'] = QueryMetrics.query_plan(conn, query, params)
+            self.metrics.record(event)
+
+    def close(self):
+        """
+        close all DB connections of the client
+        """
+        self.pool.close()
+
+    def snapshot(self, path: str = ':memory:') -> sqlite3.Connection:
+        """
+        copy the whole DB with sqlite's online backup API, e.g. as a template to be restored by each test
+        :param path: the copy's DB name (path), an in-memory DB by default
+        :return: a connection to the copy
+        """
+        template = sqlite3.connect(path, check_same_thread=False)
+        with self.pool.write_lock:
+            self.pool.writer.backup(template)
+        return template
+
+    def restore(self, template: sqlite3.Connection):
+        """
+        overwrite the whole DB (schema, data and user_version) with a snapshot, page by page, which is much faster
+        than truncating and re-seeding the tables
+        :param template: a connection to a DB, as returned by snapshot
+        """
+        with self.pool.write_lock:
+            if self.pool.writer.in_transaction:
+                self.pool.writer.rollback()
+            template.backup(self.pool.writer)
 
     def count_tables(self, raise_error=True) -> object:
         """
@@ -35,8 +98,7 @@ class DataBaseClient():
         :return: an object with the query result
         """
         query = "SELECT count() FROM sqlite_master WHERE type='table';"
-        res = self.return_query_msg.return_msg(query, fetch_all=False, commit=True)
-        return DefaultMunch.fromDict(res)
+        return self.return_query_msg.return_msg(query, fetch_all=False, commit=True)
 
     def truncate_tables(self, table_list: List[str], raise_error=True) -> object:
         """
@@ -46,22 +108,45 @@ class DataBaseClient():
         """
         out = []
         for table_name in table_list:
-            query = F"delete from {table_name};"
+            query = F'delete from "{table_name.strip()}";'
             res = self.return_query_msg.return_msg(query, commit=True)
             out.append(res)
-        return DefaultMunch.fromDict({"status": "success", "data": out})
+        return QueryResult("success", out)
 
-    def exec_sql_query(self, sql_query: str, fetch_all: bool = True, raise_error: bool = True, commit: bool = True) -> object:
+    def exec_sql_query(self, sql_query: str, fetch_all: bool = True, raise_error: bool = True, commit: bool = True,
+                       params: object = None, read_only: bool = False) -> object:
         """
         execute a single query
         :param sql_query: a string which represents a single query
+        :param params: values to be bound to the query's placeholders (a sequence or a dict for named placeholders)
         :param fetch_all: fetch a single row or all
         :param commit: whether to commit the results to the DB
         :param raise_error: stop execution when error occurs
+        :param read_only: run the query on a read connection of the pool, concurrently with other threads
         :return: an object with the query result
         """
-        res = self.return_query_msg.return_msg(sql_query, commit = True, fetch_all = fetch_all)
-        return DefaultMunch.fromDict(res)
+        return self.return_query_msg.return_msg(sql_query, raise_error=raise_error, commit=commit, fetch_all=fetch_all,
+                                                params=params, read_only=read_only)
+
+    def iter_query(self, sql_query: str, params: object = None, batch_size: int = 1000,
+                   read_only: bool = True) -> Iterator[tuple]:
+        """
+        stream the rows of a query with fetchmany, so any number of rows is walked in constant memory
+        :param sql_query: a string which represents a single query
+        :param params: values to be bound to the query's placeholders
+        :param batch_size: number of rows fetched from the cursor at a time
+        :param read_only: run on a read connection of the pool (a WAL snapshot, which does not block writes);
+                          otherwise on the writer connection, holding the write lock until the rows are exhausted
+        :return: an iterator of rows
+        """
+        with (self.pool.read() if read_only else self.pool.write()) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql_query, params or ())
+                while rows := cur.fetchmany(batch_size):
+                    yield from rows
+            finally:
+                cur.close()
 
     def exec_sql_queries(self, query: List[str] = None, json_dir: str = None, json_fn: str = None,
                          fetch_all: bool = True, raise_error=True, commit: bool = True) -> object:
@@ -86,21 +171,23 @@ class DataBaseClient():
             data_query = [query]
         else:
             data_query = query
-        for query in data_query:
-            res = self.return_query_msg.return_msg(query)
-            output.append(res)
-            if commit:
-                self.conn.commit()
-        return DefaultMunch.fromDict({"status": "success", "data": output})
+        with self.pool.write(commit=commit):
+            for query in data_query:
+                res = self.return_query_msg.return_msg(query)
+                output.append(res)
+        return QueryResult("success", output)
 
     def insert_into_table(self, json_dir: str, json_fn: str, commit: bool = True, fetch_all: bool = True,
-                          table_name: str = None, raise_error: bool = True) -> object:
+                          table_name: str = None, raise_error: bool = True, bulk: bool = False,
+                          batch_size: int = 1000) -> object:
         """
         insert a new raw into a table (or a list of tables)
         :param table_name: a single table name for insertion
         :param json_dir: json directory for the file to be loaded from
         :param json_fn: json file to be loaded from
         :param raise_error: raise an error if occurs
+        :param bulk: insert the rows in batches using bound parameters, a single transaction per batch
+        :param batch_size: number of rows per batch (bulk mode only)
         :return: an object with the query result
         """
         json_file_path = files(json_dir).joinpath(json_fn)
@@ -111,11 +198,288 @@ class DataBaseClient():
                 continue
             table_data = content.get(t_name)
             insertion_data = table_data.get('data')
+            if bulk:
+                res = self.bulk_insert(t_name, table_data.get('columns'), insertion_data, batch_size=batch_size,
+                                       raise_error=raise_error)
+                out.append(res)
+                continue
+            query = DataBaseClient.insert_query(t_name, table_data.get('columns'))
             for data_row in insertion_data:
-                query = F"INSERT INTO {t_name}({table_data.get('columns')}) VALUES ({data_row})"
-                msg = self.return_query_msg.return_msg(query, raise_error=raise_error, commit=commit, fetch_all=fetch_all)
+                try:
+                    params = self.parse_row(data_row)
+                except ValueError as err:
+                    out.append(ReturnQueryMsg.error_msg(query, err, raise_error))
+                    continue
+                msg = self.return_query_msg.return_msg(query, raise_error=raise_error, commit=commit, fetch_all=fetch_all,
+                                                       params=params)
+                out.append(msg)
+        status = 'error' if any(msg['status'] == 'error' for msg in out) else 'success'
+        return QueryResult(status, out)
+
+    def bulk_insert(self, table_name: str, columns: str, rows: Iterable, batch_size: int = 1000,
+                    raise_error: bool = True) -> object:
+        """
+        insert rows into a table with executemany, committing a single transaction per batch
+        :param table_name: the table for the data to be inserted into
+        :param columns: comma separated column names
+        :param rows: an iterable of rows; each row is either a sequence of values or a string of sql literals
+                     (as in the json insertion files), e.g. "'pixel 6', 'google pixel 6', 'pixel, phone,'"
+        :param batch_size: number of rows per batch (transaction)
+        :param raise_error: raise an error on the first failed batch, otherwise report it and continue
+        :return: an object with a status per batch and the overall rows/sec in msg
+        """
+        query = DataBaseClient.insert_query(table_name, columns)
+        out = []
+        total_rows = 0
+        start = time.perf_counter()
+        for batch_num, batch in enumerate(DataBaseClient.batched(rows, batch_size), start=1):
+            batch_start = time.perf_counter()
+            try:
+                values = [self.parse_row(row) for row in batch]
+                with self.pool.write() as conn:
+                    self.execute(conn, query, values, many=True)
+            except (sqlite3.DatabaseError, ValueError) as err:
+                msg = {"status": "error", "data": {"batch": batch_num, "rows": len(batch)}, "msg": str(err)}
+                logging.info(F"{table_name} bulk insert failed: {msg}")
+                if raise_error:
+                    raise Exception(msg)
                 out.append(msg)
-        return DefaultMunch.fromDict({"status": "success", "data": out})
+                continue
+            batch_elapsed = time.perf_counter() - batch_start
+            total_rows += len(values)
+            out.append({"status": "success", "msg": "",
+                        "data": {"batch": batch_num, "rows": len(values),
+                                 "rows_per_sec": round(len(values) / batch_elapsed) if batch_elapsed else None}})
+        elapsed = time.perf_counter() - start
+        summary = {"rows": total_rows, "batches": len(out), "seconds": round(elapsed, 6),
+                   "rows_per_sec": round(total_rows / elapsed) if elapsed else None}
+        logging.info(F"{table_name} bulk insert: {summary}")
+        status = 'error' if any(batch['status'] == 'error' for batch in out) else 'success'
+        return QueryResult(status, out, summary)
+
+    def load_feed(self, feed_path, table_name: str, columns: str = None, fmt: str = None, types: dict = None,
+                  batch_size: int = 1000, start_offset: int = 0, on_batch: Callable = None,
+                  raise_error: bool = True) -> object:
+        """
+        stream a NDJSON or CSV data feed into a table, a batch of rows per transaction, in constant memory
+        :param feed_path: path of the feed file; a NDJSON record per line, or CSV records
+        :param table_name: the table for the data to be inserted into
+        :param columns: comma separated column names, defaults to the CSV header / the keys of the first NDJSON object
+        :param fmt: 'ndjson' (or 'jsonl') or 'csv', defaults to the file's extension
+        :param types: column name -> callable converting a CSV value (empty values are inserted as NULL)
+        :param batch_size: number of rows per batch (transaction)
+        :param start_offset: byte offset to start reading from; a failed load is resumed from its resume_offset
+        :param on_batch: called as on_batch(conn, offset) within each batch's transaction, with the byte offset
+                         after the batch's last record (e.g. to checkpoint it)
+        :param raise_error: raise an error on a failed batch, otherwise return an error status
+        :return: an object with the number of inserted rows, and in msg the rows/sec and the resume_offset
+        """
+        fmt = (fmt or os.path.splitext(str(feed_path))[1].lstrip('.')).lower()
+        if fmt not in ('ndjson', 'jsonl', 'csv'):
+            raise ValueError(F"unsupported feed format: {fmt}")
+        total_rows, batch_num, offset = 0, 0, start_offset
+        start = time.perf_counter()
+        with open(feed_path, 'rb') as feed:
+            header = next(csv.reader([feed.readline().decode()])) if fmt == 'csv' else None
+            offset = max(offset, feed.tell()) if header else offset
+            columns_list = [column.strip() for column in columns.split(',')] if columns else header
+            if not columns_list:
+                feed.seek(offset)
+                first = json.loads(next((line for line in feed if line.strip()), b'{}'))
+                columns_list = list(first)
+            query = DataBaseClient.insert_query(table_name, ', '.join(columns_list))
+            feed.seek(offset)
+            records = DataBaseClient.read_feed(feed, offset, columns_list, header, types or {})
+            try:
+                for batch_num, batch in enumerate(DataBaseClient.batched(records, batch_size), start=1):
+                    with self.pool.write() as conn:
+                        self.execute(conn, query, [values for _, values in batch], many=True)
+                        if on_batch:
+                            on_batch(conn, batch[-1][0])
+                    offset = batch[-1][0]
+                    total_rows += len(batch)
+            except (sqlite3.DatabaseError, ValueError) as err:
+                msg = {"status": "error", "data": {"batch": batch_num + 1, "resume_offset": offset}, "msg": str(err)}
+                logging.info(F"{table_name} feed load failed: {msg}")
+                if raise_error:
+                    raise Exception(msg)
+                return QueryResult('error', total_rows, {"rows": total_rows, "resume_offset": offset})
+        elapsed = time.perf_counter() - start
+        summary = {"rows": total_rows, "batches": batch_num, "seconds": round(elapsed, 6),
+                   "rows_per_sec": round(total_rows / elapsed) if elapsed else None, "resume_offset": offset}
+        logging.info(F"{table_name} feed load from {feed_path}: {summary}")
+        return QueryResult('success', total_rows, summary)
+
+    @staticmethod
+    def feed_fingerprint(feed_path) -> str:
+        """
+        :param feed_path: path of a feed file
+        :return: the identity of the feed file: its device and inode, and a hash of its first line (the CSV header or
+                 the first record), which a feed keeps when it is appended to, and a rotated or replaced feed does not
+        """
+        with open(feed_path, 'rb') as feed:
+            stat = os.fstat(feed.fileno())
+            first_line = feed.readline(65536)
+        return F"{stat.st_dev}:{stat.st_ino}:{hashlib.sha1(first_line).hexdigest()}"
+
+    @staticmethod
+    def is_feed_record_end(feed_path, offset: int) -> bool:
+        """
+        :param feed_path: path of a feed file
+        :param offset: a byte offset of the feed, e.g. a checkpointed one
+        :return: True if the offset is the start of the feed or the end of one of its lines (records), with or
+                 without the line break: a last record with no line break may be followed by one when records are
+                 appended to the feed
+        """
+        if not offset:
+            return True
+        with open(feed_path, 'rb') as feed:
+            if offset > os.fstat(feed.fileno()).st_size:
+                return False
+            feed.seek(offset - 1)
+            return feed.read(1) == b'\n' or feed.read(1) in (b'', b'\n', b'\r')
+
+    @staticmethod
+    def read_feed(feed, offset: int, columns_list: List[str], header: List[str] = None,
+                  types: dict = None) -> Iterator[tuple]:
+        """
+        parse the records of a feed file, one by one; a NDJSON record is a line, a CSV record may span several lines
+        (quoted values with line breaks)
+        :param feed: a feed file opened in binary mode, positioned at offset
+        :param offset: the file's current byte offset
+        :param columns_list: column names, in the order of the returned values
+        :param header: the CSV header, None for NDJSON
+        :param types: column name -> callable converting a CSV value
+        :return: an iterator of (byte offset after the record, tuple of the record's values)
+        """
+        read_offset = [offset]
+
+        def lines() -> Iterator[str]:
+            # the csv reader pulls the lines of a record only, so the offset read so far is the record's end
+            for line in feed:
+                read_offset[0] += len(line)
+                yield line.decode()
+
+        if header:
+            records = csv.reader(lines())
+        else:
+            records = (json.loads(line) for line in lines() if line.strip())
+        for record in records:
+            if header:
+                if not record or (len(record) == 1 and not record[0].strip()):
+                    continue
+                record = {column: (types[column](value) if column in types else value) if value != '' else None
+                          for column, value in zip(header, record)}
+            if isinstance(record, list):
+                yield read_offset[0], tuple(record)
+            else:
+                yield read_offset[0], tuple(record.get(column) for column in columns_list)
+
+    def schema_version(self) -> int:
+        """
+        :return: the schema version recorded in the DB (sqlite user_version)
+        """
+        with self.pool.read() as conn:
+            return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+    def migrate(self, json_dir: str, json_fn: str, target_version: int = None) -> object:
+        """
+        upgrade (or downgrade) the DB schema to a target version by applying versioned migrations.
+        each migration runs in its own transaction, together with recording its version in the DB.
+        :param json_dir: json directory for the migrations file to be loaded from
+        :param json_fn: json file with a list of migrations: {"version": int, "description": str,
+                        "up": [queries], "down": [queries]}
+        :param target_version: version to migrate to, defaults to the latest migration
+        :return: an object with the applied migrations and the schema versions before and after
+        """
+        migrations = sorted(DataBaseClient.load_json(files(json_dir).joinpath(json_fn)), key=lambda m: m['version'])
+        current_version = self.schema_version()
+        if target_version is None:
+            target_version = migrations[-1]['version'] if migrations else current_version
+        if target_version >= current_version:
+            steps = [(m['version'], m, 'up') for m in migrations if current_version < m['version'] <= target_version]
+        else:
+            steps = [(m['version'] - 1, m, 'down') for m in reversed(migrations)
+                     if target_version < m['version'] <= current_version]
+        out = []
+        for version, migration, direction in steps:
+            try:
+                with self.pool.write() as conn:
+                    for query in migration[direction]:
+                        self.execute(conn, query)
+                    self.execute(conn, F"PRAGMA user_version = {int(version)};")
+            except sqlite3.DatabaseError as err:
+                msg = {"status": "error", "data": {"version": migration['version'], "direction": direction},
+                       "msg": str(err)}
+                logging.info(F"schema migration failed: {msg}")
+                raise Exception(msg)
+            logging.info(F"schema migration {migration['version']} ({direction}) applied: {migration['description']}")
+            out.append({"version": migration['version'], "direction": direction,
+                        "description": migration['description']})
+        return QueryResult("success", out, {"from_version": current_version, "to_version": self.schema_version()})
+
+    def explain_query_plan(self, query: str, params: object = None) -> List[str]:
+        """
+        get sqlite's query plan for a query
+        :param query: the query to be explained
+        :param params: values to be bound to the query's placeholders
+        :return: the plan's steps, e.g. "SEARCH wp USING INTEGER PRIMARY KEY (rowid=?)"
+        """
+        # explained on the writer connection, which also sees its own temp tables
+        with self.pool.write() as conn:
+            return [row[3] for row in conn.execute(F"EXPLAIN QUERY PLAN {query}", params or ())]
+
+    @staticmethod
+    def insert_query(table_name: str, columns: str) -> str:
+        """
+        build a parameterized insert query
+        :param table_name: the table for the data to be inserted into
+        :param columns: comma separated column names
+        :return: an insert query with a placeholder per column
+        """
+        columns_list = [column.strip() for column in columns.split(',')]
+        return F"INSERT INTO {table_name}({', '.join(columns_list)}) VALUES ({', '.join('?' * len(columns_list))})"
+
+    # a single sql literal of an insertion row and its separator: a quoted string ('' escapes a quote), a number or NULL
+    sql_literal = re.compile(r"\s*(?:'((?:[^']|'')*)'|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|(NULL))\s*(,|$)",
+                             re.IGNORECASE)
+
+    @staticmethod
+    def parse_row(row) -> tuple:
+        """
+        convert an insertion row to a tuple of values to be bound to a query
+        :param row: a sequence of values, or a string of comma separated sql literals (strings, numbers and NULL)
+        :return: a tuple of values
+        """
+        if not isinstance(row, str):
+            return tuple(row)
+        values, pos = [], 0
+        while True:
+            match = DataBaseClient.sql_literal.match(row, pos)
+            if not match:
+                raise ValueError(F"invalid sql literal at position {pos} of row: {row}")
+            text, number, _, separator = match.groups()
+            if text is not None:
+                values.append(text.replace("''", "'"))
+            elif number is not None:
+                values.append(float(number) if any(char in number for char in '.eE') else int(number))
+            else:
+                values.append(None)
+            pos = match.end()
+            if not separator:
+                return tuple(values)
+
+    @staticmethod
+    def batched(rows: Iterable, batch_size: int) -> Iterator[list]:
+        """
+        split an iterable into lists of batch_size items (the last one may be shorter)
+        :param rows: an iterable
+        :param batch_size: max number of items per list
+        :return: an iterator of lists
+        """
+        iterator = iter(rows)
+        while batch := list(islice(iterator, batch_size)):
+            yield batch
 
     @classmethod
     def load_json(cls, json_path) -> dict:
@@ -129,40 +493,92 @@ class DataBaseClient():
             return content
 
 
+class QueryResult():
+    """
+    the result of a query (or a group of queries); accessible as attributes (res.data) or as dict keys (res['data'])
+    """
+    __slots__ = ('status', 'data', 'msg')
+
+    def __init__(self, status: str = "", data: object = None, msg: object = ""):
+        self.status = status
+        self.data = data
+        self.msg = msg
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self) -> dict:
+        return {"status": self.status, "data": self.data, "msg": self.msg}
+
+    def __eq__(self, other):
+        if isinstance(other, QueryResult):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return F"QueryResult(status={self.status!r}, data={self.data!r}, msg={self.msg!r})"
+
+
 @dataclass
 class ReturnQueryMsg:
-    conn: object
+    pool: ConnectionPool
+    metrics: QueryMetrics = None
 
-    def parse_res(self, fetch_all):
+    @staticmethod
+    def parse_res(cur, fetch_all):
         if fetch_all:
-            res = self.cur.fetchall()
-        else:
-            res = self.cur.fetchone()
+            return cur.fetchall()
+        res = cur.fetchone()
         if res and len(res) == 1:
             res = res[0]
         return res
 
-    def is_error(self, query, commit, fetch_all):
+    def is_error(self, query, commit, fetch_all, params=None, read_only=False):
+        event = {"type": "statement", "query": query}
+        start = time.perf_counter()
         try:
-            self.cur = self.conn.cursor()
-            self.cur.execute(query)
-            res = self.parse_res(fetch_all)
-            if commit:
-                self.conn.commit()
+            # reads run on a checked out read connection, writes are serialized on the writer connection.
+            # each connection reuses its cursor; its statement cache spares re-preparing the queries
+            with (self.pool.read() if read_only else self.pool.write(commit=commit)) as conn:
+                cur = self.pool.cursor(conn)
+                cur.execute(query, params or ())
+                res = self.parse_res(cur, fetch_all)
+                executed = time.perf_counter()
+                event['rows'] = len(res) if fetch_all else (1 if res is not None else 0)
+                if self.metrics and self.metrics.is_slow(executed - start):
+                    event['plan'] = QueryMetrics.query_plan(conn, query, params)
+            # the block's exit commits the transaction (when it is not nested in another one)
+            event['commit_seconds'] = time.perf_counter() - executed if commit and not read_only else 0.0
         except sqlite3.DatabaseError as err:
+            event['error'] = str(err)
             return True, err
+        finally:
+            event['seconds'] = time.perf_counter() - start
+            if self.metrics:
+                self.metrics.record(event)
         return False, res
 
-    def return_msg(self, query, raise_error=True, commit=True, fetch_all=True):
-        msg = {"status": "", "data": "", "query": F"{query}", "msg": ""}
-        is_error, res = self.is_error(query, commit, fetch_all)
+    def return_msg(self, query, raise_error=True, commit=True, fetch_all=True, params=None, read_only=False):
+        is_error, res = self.is_error(query, commit, fetch_all, params, read_only)
         if is_error:
-            msg['status'] = 'error'
-            msg['msg'] = res
-            logging.info(msg)
-            if raise_error:
-                raise Exception(msg)
-        else:
-            msg['status'] = 'success'
-            msg['data'] = res
+            return self.error_msg(query, res, raise_error)
+        return QueryResult('success', res)
+
+    @staticmethod
+    def error_msg(query, err, raise_error=True):
+        msg = QueryResult('error', "", err)
+        # the query text is kept for errors only
+        logging.error({**msg.to_dict(), "query": query})
+        if raise_error:
+            raise Exception({**msg.to_dict(), "query": query})
         return msg
@@ -0,0 +1,160 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable
+
+logging.getLogger()
+
+# the job (e.g. update_ranking_job) which the current thread / task runs, used to tag the queries
+current_job = ContextVar('current_job', default='')
+
+
+def instrumented_job(func: Callable) -> Callable:
+    """
+    a decorator for the clients' jobs and apis, tagging the queries they run with their name and timing them
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.job(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class QueryMetrics():
+    """
+    aggregated per job and statement counters of the executed queries (calls, errors, latency, rows, commit time),
+    a log of the slow ones with their query plan, and pluggable hooks which get every query event.
+    an event is a dict: {"type": "statement"|"transaction"|"job"|"batch", "job": str, "query": str, "seconds": float,
+    "rows": int, "commit_seconds": float, "error": str, "plan": list}
+    """
+
+    def __init__(self, slow_query_threshold: float = 0.5, slow_query_log_size: int = 100):
+        """
+        :param slow_query_threshold: seconds above which a statement is logged as slow, with its query plan
+        :param slow_query_log_size: number of slow queries kept
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self.hooks = []
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        """
+        :param hook: called with every query event
+        """
+        self.hooks.append(hook)
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.slow_query_threshold is not None and seconds >= self.slow_query_threshold
+
+    @contextmanager
+    def job(self, name: str):
+        """
+        tag the queries run within the block with a job name, and time the job (nested jobs keep the outer name)
+        :param name: job name
+        """
+        if current_job.get():
+            yield
+            return
+        token = current_job.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record({"type": "job", "query": name, "seconds": time.perf_counter() - start})
+            current_job.reset(token)
+
+    @staticmethod
+    def query_plan(conn: sqlite3.Connection, query: str, params: object = None) -> list:
+        """
+        :param conn: the connection which executed the query
+        :param query: an executed query
+        :param params: the values bound to the query's placeholders
+        :return: the query plan's steps, or None for a query which cannot be explained again (e.g. a CREATE TABLE)
+        """
+        try:
+            return [row[3] for row in conn.execute(F"EXPLAIN QUERY PLAN {query}", params or ())]
+        except sqlite3.DatabaseError:
+            return None
+
+    @staticmethod
+    def statement(query: str) -> str:
+        """
+        :param query: a query
+        :return: the whole query as a single line, which its counters are aggregated by
+        """
+        return ' '.join(query.split())
+
+    def record(self, event: dict):
+        """
+        aggregate a query event and pass it to the hooks
+        :param event: a query event, see the class docstring
+        """
+        event.setdefault("job", current_job.get())
+        key = (event['type'], event['job'], QueryMetrics.statement(event.get('query') or ''))
+        with self._lock:
+            counters = self._counters.setdefault(key, {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                       "rows": 0, "commit_seconds": 0.0})
+            counters['calls'] += 1
+            counters['errors'] += 1 if event.get('error') else 0
+            counters['seconds'] += event['seconds']
+            counters['max_seconds'] = max(counters['max_seconds'], event['seconds'])
+            counters['rows'] += event.get('rows') or 0
+            counters['commit_seconds'] += event.get('commit_seconds') or 0.0
+            if event['type'] == 'statement' and self.is_slow(event['seconds']):
+                self.slow_queries.append(event)
+        if event['type'] == 'statement' and self.is_slow(event['seconds']):
+            logging.warning(F"slow query ({event['seconds']:.3f}s) in {event['job'] or 'no job'}: "
+                            F"{key[2]}, plan: {event.get('plan')}")
+        for hook in self.hooks:
+            hook(event)
+
+    def counters(self) -> list:
+        """
+        :return: a list of counters per (type, job, statement)
+        """
+        with self._lock:
+            return [{"type": key[0], "job": key[1], "statement": key[2], **values}
+                    for key, values in self._counters.items()]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self.slow_queries.clear()
+
+    def to_json(self) -> str:
+        """
+        :return: the counters and the slow queries log as json
+        """
+        return json.dumps({"counters": self.counters(), "slow_queries": list(self.slow_queries)}, default=str)
+
+    def to_prometheus(self, prefix: str = 'search_engine_query') -> str:
+        """
+        :param prefix: metrics names prefix
+        :return: the counters in prometheus text exposition format
+        """
+        metrics = {"calls": ('counter', 'number of executions'), "errors": ('counter', 'number of failed executions'),
+                   "seconds": ('counter', 'total execution seconds'), "max_seconds": ('gauge', 'max execution seconds'),
+                   "rows": ('counter', 'number of returned rows'),
+                   "commit_seconds": ('counter', 'total commit seconds')}
+        counters = self.counters()
+        lines = []
+        for metric, (metric_type, description) in metrics.items():
+            name = F"{prefix}_{metric}" + ('_total' if metric_type == 'counter' else '')
+            lines += [F"# HELP {name} {description}", F"# TYPE {name} {metric_type}"]
+            for counter in counters:
+                labels = ','.join(F'{label}="{QueryMetrics.escape(counter[label])}"'
+                                  for label in ('type', 'job', 'statement'))
+                lines.append(F"{name}{{{labels}}} {counter[metric]}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -7,23 +7,83 @@ from clients.api.search_web_activities import SearchWebsiteActivities
 
 
 @fixture(scope="session")
-def init_client() -> SearchWebsiteActivities:
+def init_client(tmp_path_factory) -> SearchWebsiteActivities:
     """
-    instantiate the search_client
+    instantiate the search_client. with is_test_db_template, on a DB of its own in a temp folder (a folder per
+    pytest-xdist worker), so the tests can run in parallel
     :return: client instant
     """
-    test_client = SearchWebsiteActivities(**vars(settings))
-    return test_client
+    if not settings.is_test_db_template:
+        yield SearchWebsiteActivities(**vars(settings))
+        return
+    db_dir = tmp_path_factory.mktemp('db')
+    # absolute file names override the package folders of the settings
+    test_client = SearchWebsiteActivities(**{**vars(settings), "db_name": str(db_dir / settings.db_name),
+                                             "data_jobs_fn": str(db_dir / settings.data_jobs_fn),
+                                             "search_snapshot_fn": str(db_dir / settings.search_snapshot_fn),
+                                             "is_delete_tables": False, "is_create_tables": True})
+    yield test_client
+    test_client.close()
+
+
+@fixture(scope="session")
+def db_template(init_client):
+    """
+    the seeded DB (created tables and migrations, and the ranking_parameters table) which every test starts from,
+    as an in-memory snapshot
+    :return: a connection to the template DB, or None if is_test_db_template is off
+    """
+    if not settings.is_test_db_template:
+        yield None
+        return
+    init_client.tear_down()
+    init_client.insert_ranking_parameters()
+    template = init_client.snapshot()
+    yield template
+    template.close()
 
 
 @fixture(scope="function")
-def test_client(init_client) -> SearchWebsiteActivities:
+def test_client(init_client, db_template) -> SearchWebsiteActivities:
+    """
+    the main client, which responsible for running the jobs, inserting websites and perform search, on a seeded DB
+    (created tables and the ranking_parameters table) of its own for the test
+    :return: client instant
+    """
+    if db_template is not None:
+        # restoring the template with the backup API replaces tear_down's truncation and re-seeding
+        init_client.restore(db_template)
+        return init_client
     init_client.tear_down()
     # insert into insert_ranking_parameters DB table.
     init_client.insert_ranking_parameters()
     return init_client
 
 
+@fixture(scope="function")
+def sites_client(test_client) -> SearchWebsiteActivities:
+    """
+    the test client, with the products and the websites of test_search_results_sorted_by_priority.json inserted
+    (the websites are queued for the ranking job)
+    :return: client instant
+    """
+    test_client.insert_products_job()
+    for website in cfg_get_data('test_search_results_sorted_by_priority.json')['websites']:
+        test_client.insert_new_site_into_search_engine_api(website['url'], website['product'], website['keywords'],
+                                                           website['seniority'], website['ref'])
+    return test_client
+
+
+@fixture(scope="function")
+def ranked_client(sites_client) -> SearchWebsiteActivities:
+    """
+    the sites client, after the ranking job ranked its websites
+    :return: client instant
+    """
+    sites_client.update_ranking_job()
+    return sites_client
+
+
 def cfg_get_data(test_name: str) -> dict:
     """
     Rendering config data out of a template cfg file
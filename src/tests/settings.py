@@ -2,21 +2,58 @@ cfg_tests_dir = 'data.cfg_tests'
 db_client_dir = 'clients.db'
 db_data_dir = 'data.db_data'
 db_name = 'searching_engine.db'
+cached_statements = 256
+journal_mode = 'wal'
+synchronous = 'normal'
+cache_size = -16000
+mmap_size = 268435456
+slow_query_threshold = 0.2
+max_readers = 8
 table_del_fn = 'tables_deletion.json'
 table_creation_fn = 'tables_creation.json'
+schema_migrations_fn = 'schema_migrations.json'
 products_tn = 'products'
 products_insert_fn = 'db_products_insertion.json'
+products_feed_fn = 'db_products_feed.ndjson'
+products_feed_columns = 'name, description, keywords'
 rank_insert_fn = 'db_data_insertion.json'
 rank_tn = 'ranking_parameters'
-search_engine_ranking_col = 'website_product_rel_id, parameter_id, parameter_value, parameter_grade'
+search_engine_ranking_col = 'website_product_rel_id, parameter_id, parameter_value, parameter_grade, parameter_units'
 search_query_fn = 'db_search_query.txt'
+search_results_limit = 3
+search_max_page_size = 100
+search_rank_weight = 0.8
+search_text_weight = 0.2
+search_rank_scale = 100
+search_text_scale = 1
+search_bm25_weights = '1.0, 0.5, 2.0'
+search_mode = 'db'
+search_snapshot_fn = 'search_snapshot.bin'
+search_snapshot_top_k = 10
+search_snapshot_refresh_interval = 1.0
+is_export_search_snapshot = False
+search_cache_size = 1024
+search_cache_ttl = 60
+product_cache_size = 10000
+ranking_queries_fn = 'db_ranking_queries.json'
+allowed_full_scans = 'st, rp, temp.ranking_staging, json_each'
 data_jobs_fn = 'to_be_inserted_into_ranking.txt'
 data_jobs_dir = 'data.jobs_data'
-tables_list = "websites, products, websites_products, search_engine_ranking, ranking_parameters"
+tables_list = "websites, products, websites_products, search_engine_ranking, ranking_parameters, product_keywords, ranking_job_queue, job_checkpoints, website_scores"
 is_delete_updating_ranking_file = True
+is_test_db_template = True
 is_delete_tables = False
 is_create_tables = False
 is_truncate_tables = True
+is_bulk_insert = True
+insert_batch_size = 1000
+ranking_job_chunk_size = 10000
+ranking_recompute_processes = 0
+ranking_recompute_chunk_size = 100000
+async_max_workers = 8
+async_batch_size = 500
+async_batch_window = 0.005
+async_max_queue_size = 10000
 
 
 
@@ -0,0 +1,85 @@
+import asyncio
+import sqlite3
+from clients.api.async_search_activities import AsyncSearchWebsiteActivities
+from conftest import cfg_get_data
+
+
+def test_async_insertions_are_batched(test_client):
+    """
+    Concurrent site insertions are coalesced into batches, and concurrent searches see the committed websites.
+    :return: None. assert the unique urls, the number of batches and the search results.
+    """
+    test_client.insert_products_job()
+    websites = cfg_get_data('test_search_results_sorted_by_priority.json')['websites'] * 8
+
+    async def run():
+        async with AsyncSearchWebsiteActivities(test_client, batch_size=20, batch_window=0.5) as async_client:
+            unique_urls = await asyncio.gather(*(
+                async_client.insert_new_site_into_search_engine_api(website['url'], website['product'],
+                                                                    website['keywords'], website['seniority'],
+                                                                    website['ref']) for website in websites))
+            await async_client.run(test_client.update_ranking_job)
+            searches = await asyncio.gather(*(async_client.get_search_term_options('leisure time') for _ in range(5)))
+            return unique_urls, searches, async_client.stats()
+
+    unique_urls, searches, stats = asyncio.run(run())
+    for website, unique_url in zip(websites, unique_urls):
+        # a website with missing input is not inserted, as with the synchronous api
+        assert unique_url.startswith(website['url']) if website['keywords'] else unique_url is None
+    # how many batches the sites are coalesced into depends on the timing, within the batch size
+    assert stats['batched_sites'] == len(websites) and 1 < stats['max_batch_size'] <= 20
+    assert len(websites) // 20 <= stats['batches'] < len(websites)
+    assert all(res == searches[0] and res['status'] == 'success' and res['data'] for res in searches)
+
+
+def test_async_failed_batch_and_close(test_client, monkeypatch):
+    """
+    Every caller of a batch which fails site by site gets the error, and a closed facade refuses new work with a clear
+    error.
+    :param monkeypatch: makes the batch insertion fail
+    :return: None. assert the callers' errors and the stats.
+    """
+    error = sqlite3.OperationalError('database is locked')
+
+    def insert_new_sites(sites):
+        raise error
+
+    monkeypatch.setattr(test_client, 'insert_new_sites', insert_new_sites)
+    keywords = {"key1": "pixel 8", "key2": "leisure time"}
+
+    async def run():
+        async_client = AsyncSearchWebsiteActivities(test_client, batch_size=5, batch_window=0.5)
+        results = await asyncio.gather(*(
+            async_client.insert_new_site_into_search_engine_api(F"www.site{idx}.com", 'pixel 8', keywords, 10)
+            for idx in range(5)), return_exceptions=True)
+        await async_client.close()
+        closed_errors = await asyncio.gather(
+            async_client.insert_new_site_into_search_engine_api('www.late.com', 'pixel 8', keywords, 10),
+            async_client.get_search_term_options('pixel'), return_exceptions=True)
+        return results, closed_errors, async_client.stats()
+
+    results, closed_errors, stats = asyncio.run(run())
+    assert all(res is error for res in results)
+    assert all(isinstance(err, RuntimeError) and 'closed' in str(err) for err in closed_errors)
+    assert stats['batches'] == 5 and stats['batched_sites'] == 5
+
+
+def test_async_batch_with_a_bad_site(test_client):
+    """
+    A bad site fails its caller only; the other sites of its batch are written.
+    :return: None. assert the callers' results and the inserted websites.
+    """
+    keywords = [{"key1": "pixel 8", "key2": "leisure time"}] * 9
+    keywords.insert(6, {"a": 5})
+
+    async def run():
+        async with AsyncSearchWebsiteActivities(test_client, batch_size=10, batch_window=0.5) as async_client:
+            return await asyncio.gather(*(
+                async_client.insert_new_site_into_search_engine_api(F"www.site{idx}.com", 'pixel 8', site_keywords, 10)
+                for idx, site_keywords in enumerate(keywords)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[6], AttributeError)
+    assert all(unique_url.startswith(F"www.site{idx}.com/") for idx, unique_url in enumerate(results) if idx != 6)
+    urls = test_client.exec_sql_query("SELECT url FROM websites ORDER BY id;").data
+    assert [url for url, in urls] == [F"www.site{idx}.com" for idx in range(10) if idx != 6]
@@ -0,0 +1,126 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from clients.db.data_base_client import DataBaseClient, QueryResult
+
+
+def test_query_result_access():
+    """
+    A query result is accessible by attributes as well as by dict keys.
+    :return: None. assert the result's fields.
+    """
+    client = DataBaseClient(':memory:')
+    res = client.exec_sql_query("SELECT count() FROM sqlite_master WHERE type='table';", fetch_all=False)
+    assert isinstance(res, QueryResult)
+    assert res.status == res['status'] == 'success'
+    assert res.data == res.get('data') == 0
+    assert res == {"status": "success", "data": 0, "msg": ""}
+
+
+def test_iter_query_streams_rows():
+    """
+    iter_query walks all the rows of a query, batch by batch.
+    :return: None. assert the streamed rows.
+    """
+    client = DataBaseClient(':memory:')
+    client.exec_sql_query("CREATE TABLE numbers (n integer);")
+    res = client.bulk_insert('numbers', 'n', ((n,) for n in range(2500)), batch_size=1000)
+    assert res.status == 'success' and res.msg['rows'] == 2500
+    rows = client.iter_query("SELECT n FROM numbers ORDER BY n;", batch_size=100)
+    assert [n for n, in rows] == list(range(2500))
+
+
+def test_bulk_insert_batch_errors(tmp_path):
+    """
+    Rows of sql literals are parsed into typed values, and a failed batch (a malformed row or a constraint violation)
+    is reported by its number without stopping the following batches; without bulk, a malformed row is reported as
+    the row's error.
+    :param tmp_path: temp folder for the insertion json file
+    :return: None. assert the batches' statuses and the inserted rows.
+    """
+    client = DataBaseClient(':memory:')
+    client.exec_sql_query("CREATE TABLE items (name text NOT NULL, price real, amount integer);")
+    rows = ["'pixel 6', 599.9, 3", "'o''reilly, books', -1.5e1, NULL",
+            "'shkatulka', 10, 'x' 'y'", "'pixel 8', 699, 1",
+            "NULL, 1, 1", "'Xioami Box S2', .5, -2",
+            "'pixel 9', 799, 5"]
+    res = client.bulk_insert('items', 'name, price, amount', rows, batch_size=2, raise_error=False)
+    assert res.status == 'error' and res.msg['rows'] == 3
+    assert [(batch['status'], batch['data']['batch']) for batch in res.data] == \
+           [('success', 1), ('error', 2), ('error', 3), ('success', 4)]
+    assert 'invalid sql literal' in res.data[1]['msg'] and 'NOT NULL' in res.data[2]['msg']
+    rows = client.exec_sql_query("SELECT name, price, amount FROM items ORDER BY rowid;").data
+    assert rows == [('pixel 6', 599.9, 3), ("o'reilly, books", -15.0, None), ('pixel 9', 799.0, 5)]
+    json_path = tmp_path / 'items.json'
+    json_path.write_text(json.dumps({"items": {"columns": "name, price, amount",
+                                               "data": ["'shkatulka', 10, 'x' 'y'", "'pixel 8', 699, 1"]}}))
+    res = client.insert_into_table('data', str(json_path), raise_error=False)
+    assert [msg.status for msg in res.data] == ['error', 'success'] and 'invalid sql literal' in str(res.data[0].msg)
+
+
+def test_load_feed_resumes_from_offset(tmp_path):
+    """
+    A CSV feed load which fails on a bad record keeps the committed batches, and is resumed from its resume_offset.
+    :param tmp_path: temp folder for the feed file
+    :return: None. assert the loaded rows.
+    """
+    client = DataBaseClient(':memory:')
+    client.exec_sql_query("CREATE TABLE numbers (n integer NOT NULL, name text);")
+    feed_path = tmp_path / 'numbers.csv'
+    feed_path.write_text("n,name\n1,one\n2,two\nx,three\n4,four\n")
+    res = client.load_feed(feed_path, 'numbers', types={"n": int}, batch_size=2, raise_error=False)
+    assert res.status == 'error' and res.data == 2
+    assert res.msg['resume_offset'] == len("n,name\n1,one\n2,two\n")
+    feed_path.write_text(feed_path.read_text().replace('x,three', '3,three'))
+    res = client.load_feed(feed_path, 'numbers', types={"n": int}, batch_size=2, start_offset=res.msg['resume_offset'])
+    assert res.status == 'success' and res.data == 2
+    rows = client.exec_sql_query("SELECT n, name FROM numbers ORDER BY n;").data
+    assert rows == [(1, 'one'), (2, 'two'), (3, 'three'), (4, 'four')]
+
+
+def test_query_metrics_slow_query_log():
+    """
+    Statements are aggregated per job and statement, and the slow ones are logged with their query plan.
+    :return: None. assert the counters, the slow queries log and the prometheus export.
+    """
+    client = DataBaseClient(':memory:', slow_query_threshold=0.0)
+    events = []
+    client.metrics.add_hook(events.append)
+    client.exec_sql_query("CREATE TABLE numbers (n integer);")
+    with client.metrics.job('numbers_job'):
+        for _ in range(3):
+            client.exec_sql_query("SELECT n FROM numbers WHERE n > ?;", params=(1,))
+    counters = [counter for counter in client.metrics.counters() if counter['job'] == 'numbers_job']
+    statement = next(counter for counter in counters if counter['type'] == 'statement')
+    assert statement['calls'] == 3 and statement['statement'] == 'SELECT n FROM numbers WHERE n > ?;'
+    assert client.metrics.slow_queries[-1]['plan'] == ['SCAN numbers']
+    assert events[-1] == {"type": "job", "query": "numbers_job", "seconds": events[-1]['seconds'],
+                          "job": "numbers_job"}
+    assert 'search_engine_query_calls_total{type="statement",job="numbers_job",' in client.metrics.to_prometheus()
+
+
+def test_concurrent_reads_and_writes(tmp_path):
+    """
+    Threads read and write concurrently on a bounded pool of read connections, which are reused rather than opened
+    per thread.
+    :param tmp_path: temp folder for the DB file
+    :return: None. assert the read rows and the number of opened read connections.
+    """
+    client = DataBaseClient(str(tmp_path / 'numbers.db'), max_readers=3)
+    client.exec_sql_query("CREATE TABLE numbers (n integer);")
+
+    def insert_and_count(n: int) -> int:
+        client.exec_sql_query("INSERT INTO numbers (n) VALUES (?);", params=(n,))
+        with client.pool.read() as conn:
+            # a nested read block of the thread shares its connection
+            assert client.exec_sql_query("SELECT count() FROM numbers WHERE n = ?;", fetch_all=False,
+                                         params=(n,), read_only=True).data == 1
+            return conn.execute("SELECT count() FROM numbers;").fetchone()[0]
+
+    for first in (0, 200):
+        # a new executor's threads check out the pool's former connections
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = list(executor.map(insert_and_count, range(first, first + 200)))
+        assert all(first < count <= first + 200 for count in counts)
+    assert client.exec_sql_query("SELECT count() FROM numbers;", fetch_all=False, read_only=True).data == 400
+    assert 1 <= len(client.pool._readers) <= 3
+    client.close()
@@ -0,0 +1,53 @@
+import json
+from importlib.resources import files
+from tests import settings
+
+
+def test_schema_migrations(test_client):
+    """
+    The DB is at the latest schema version, and the migrations can be rolled back and re-applied in place.
+    :return: None. assert the schema version after each migration.
+    """
+    migrations = json.loads(files(settings.db_data_dir).joinpath(settings.schema_migrations_fn).read_text())
+    latest_version = max(migration['version'] for migration in migrations)
+    assert test_client.schema_version() == latest_version
+    res = test_client.migrate_db_schema(target_version=0)
+    assert test_client.schema_version() == 0, F"wrong schema version after downgrade: {res}"
+    res = test_client.migrate_db_schema()
+    assert test_client.schema_version() == latest_version, F"wrong schema version after upgrade: {res}"
+
+
+def test_queries_use_indexes(test_client):
+    """
+    The search query and the ranking job queries do not scan whole tables.
+    :return: None. assert that no query plan has an unexpected full table scan.
+    """
+    plans = test_client.check_query_plans()
+    full_scans = {name: plan['full_scans'] for name, plan in plans.items() if plan['full_scans']}
+    assert not full_scans, F"queries which do not use an index: {full_scans}"
+
+
+def test_product_keywords_index(test_client):
+    """
+    The product_keywords table holds each product's keywords (trimmed and lower cased), and is kept in sync with
+    the products' inserts, keywords updates and deletes.
+    :return: None. assert the indexed keywords after each change.
+    """
+    def indexed(product_id: int) -> list:
+        return [keyword for keyword, in test_client.exec_sql_query(
+            "SELECT keyword FROM product_keywords WHERE product_id = ? ORDER BY keyword;", params=(product_id,)).data]
+
+    test_client.insert_products_job()
+    product_id = test_client.exec_sql_query("SELECT id FROM products WHERE name = 'pixel 8';", fetch_all=False).data
+    assert indexed(product_id) == ['leisure time', 'pixel 8']
+    rows = test_client.exec_sql_query("""SELECT count() FROM product_keywords pk LEFT JOIN products p
+                                         ON p.id = pk.product_id WHERE p.id IS NULL;""", fetch_all=False).data
+    assert rows == 0
+    test_client.exec_sql_query("UPDATE products SET keywords = ? WHERE id = ?;",
+                               params=(' Pixel 8 ,"Quoted" \\ slash,\tphone\n,, ', product_id))
+    assert indexed(product_id) == ['"quoted" \\ slash', 'phone', 'pixel 8']
+    test_client.exec_sql_query("DELETE FROM products WHERE id = ?;", params=(product_id,))
+    assert indexed(product_id) == []
+    test_client.exec_sql_query("INSERT INTO products (name, keywords) VALUES ('pixel 9', 'pixel 9, leisure time,');")
+    product_id = test_client.exec_sql_query("SELECT max(id) FROM products;", fetch_all=False).data
+    assert indexed(product_id) == ['leisure time', 'pixel 9']
@@ -0,0 +1,70 @@
+from clients.api.product_cache import ProductCatalogCache
+
+
+class CatalogLoader():
+    """
+    a products catalog loader, which records the names it was asked to load
+    """
+
+    def __init__(self, catalog: dict):
+        self.catalog = catalog
+        self.loaded = []
+
+    def __call__(self, names: list) -> dict:
+        self.loaded += sorted(names)
+        return {name: self.catalog[name] for name in names if name in self.catalog}
+
+
+def test_product_cache_hit_and_miss():
+    """
+    A found product is served from the cache, while a name which is not in the catalog is looked up again, and is
+    found once the product is inserted.
+    :return: None. assert the products and the names loaded from the catalog.
+    """
+    cache = ProductCatalogCache(max_size=10)
+    loader = CatalogLoader({"pixel 8": (1, frozenset({'pixel 8', 'leisure time'}))})
+    assert cache.get_many(['pixel 8', 'pixel 9'], loader) == {"pixel 8": loader.catalog['pixel 8']}
+    assert cache.get_many(['pixel 8', 'pixel 9'], loader) == {"pixel 8": loader.catalog['pixel 8']}
+    assert loader.loaded == ['pixel 8', 'pixel 9', 'pixel 9']
+    loader.catalog['pixel 9'] = (2, frozenset({'pixel 9'}))
+    assert cache.get_many(['pixel 9'], loader) == {"pixel 9": loader.catalog['pixel 9']}
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 4}
+
+
+def test_product_cache_invalidation():
+    """
+    After invalidate, the products are loaded from the catalog again, and products which were loaded while the
+    cache was invalidated are not cached.
+    :return: None. assert the products and the names loaded from the catalog.
+    """
+    cache = ProductCatalogCache(max_size=10)
+    loader = CatalogLoader({"pixel 8": (1, frozenset({'pixel 8'}))})
+    cache.get_many(['pixel 8'], loader)
+    loader.catalog['pixel 8'] = (1, frozenset({'pixel 8', 'leisure time'}))
+    cache.invalidate()
+    assert cache.get_many(['pixel 8'], loader) == {"pixel 8": loader.catalog['pixel 8']}
+    assert loader.loaded == ['pixel 8', 'pixel 8']
+
+    def invalidating_loader(names: list) -> dict:
+        cache.invalidate()
+        return loader(names)
+
+    cache.invalidate()
+    cache.get_many(['pixel 8'], invalidating_loader)
+    cache.get_many(['pixel 8'], loader)
+    assert loader.loaded == ['pixel 8'] * 4
+
+
+def test_site_of_a_later_inserted_product(test_client):
+    """
+    A website of a product which was not in the catalog is inserted once the product is, even when the product is
+    inserted by another writer (which does not invalidate the client's cache).
+    :return: None. assert the website's link to the product before and after the product's insertion.
+    """
+    keywords = {"key1": "pixel 9", "key2": "leisure time"}
+    linked_query = "SELECT count() FROM websites_products WHERE unique_url=?;"
+    unique_url = test_client.insert_new_site_into_search_engine_api('www.googlestore.com', 'pixel 9', keywords, 40)
+    assert test_client.exec_sql_query(linked_query, fetch_all=False, params=(unique_url,)).data == 0
+    test_client.exec_sql_query("INSERT INTO products (name, keywords) VALUES ('pixel 9', 'pixel 9, leisure time,');")
+    unique_url = test_client.insert_new_site_into_search_engine_api('www.googlestore.com', 'pixel 9', keywords, 40)
+    assert test_client.exec_sql_query(linked_query, fetch_all=False, params=(unique_url,)).data == 1
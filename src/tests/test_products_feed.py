@@ -0,0 +1,104 @@
+import json
+import os
+
+
+def write_feed(feed_path, products: list):
+    """
+    write products into a NDJSON feed, replacing a former feed file (as a feed rotation does)
+    :param feed_path: feed file path
+    :param products: (name, description, keywords) tuples
+    """
+    tmp_path = F"{feed_path}.tmp"
+    with open(tmp_path, 'w') as feed:
+        for name, description, keywords in products:
+            feed.write(json.dumps({"name": name, "description": description, "keywords": keywords}) + '\n')
+    os.replace(tmp_path, feed_path)
+
+
+def test_products_feed_rotation(test_client, tmp_path):
+    """
+    A loaded feed is resumed after its checkpoint when it is appended to, and a rotated feed (another file at the
+    same path) is loaded from its start rather than from the checkpoint of the former file.
+    :param tmp_path: temp folder for the feed file
+    :return: None. assert the loaded products.
+    """
+    feed_path = tmp_path / 'products.ndjson'
+    write_feed(feed_path, [('pixel 8', 'pixel 8', 'pixel 8,'), ('shkatulka', 'russian learning book', 'languages,')])
+    assert test_client.insert_products_feed_job(feed_path).data == 2
+    with open(feed_path, 'a') as feed:
+        feed.write(json.dumps({"name": "pixel 9", "description": "pixel 9", "keywords": "pixel 9,"}) + '\n')
+    assert test_client.insert_products_feed_job(feed_path).data == 1
+    write_feed(feed_path, [('Xioami Box S2', 'Xioami streamer', 'streamer,')])
+    assert test_client.insert_products_feed_job(feed_path).data == 1
+    names = test_client.exec_sql_query("SELECT name FROM products ORDER BY id;").data
+    assert [name for name, in names] == ['pixel 8', 'shkatulka', 'pixel 9', 'Xioami Box S2']
+
+
+def test_products_feed_csv(test_client, tmp_path):
+    """
+    A CSV feed is loaded record by record, including quoted values with commas and line breaks.
+    :param tmp_path: temp folder for the feed file
+    :return: None. assert the loaded products.
+    """
+    feed_path = tmp_path / 'products.csv'
+    feed_path.write_text('name,description,keywords\n'
+                         'pixel 8,"google pixel 8,\nsmartphone","pixel 8, leisure time,"\n'
+                         '\n'
+                         'shkatulka,"russian ""learning"" book","languages, leisure time,"\n')
+    res = test_client.insert_products_feed_job(feed_path)
+    assert res.status == 'success' and res.data == 2
+    assert res.msg['resume_offset'] == feed_path.stat().st_size
+    rows = test_client.exec_sql_query("SELECT name, description, keywords FROM products ORDER BY id;").data
+    assert rows == [('pixel 8', 'google pixel 8,\nsmartphone', 'pixel 8, leisure time,'),
+                    ('shkatulka', 'russian "learning" book', 'languages, leisure time,')]
+
+
+def test_products_feed_ndjson(test_client):
+    """
+    The default NDJSON feed is loaded whole, and running the job again loads nothing.
+    :return: None. assert the loaded products.
+    """
+    res = test_client.insert_products_feed_job()
+    assert res.status == 'success' and res.data == 5
+    assert test_client.insert_products_feed_job().data == 0
+    assert test_client.exec_sql_query("SELECT count() FROM products;", fetch_all=False).data == 5
+
+
+def test_products_feed_resume(test_client, tmp_path, monkeypatch):
+    """
+    A feed load which fails on a bad record keeps its committed batches, and is resumed after them (not from the
+    feed's start) once the record is fixed.
+    :param tmp_path: temp folder for the feed file
+    :param monkeypatch: sets a batch of 2 products
+    :return: None. assert the loaded products.
+    """
+    monkeypatch.setattr(test_client, 'insert_batch_size', 2)
+    products = [(F"product {idx}", F"description {idx}", F"keyword {idx},") for idx in range(5)]
+    feed_path = tmp_path / 'products.ndjson'
+    write_feed(feed_path, products[:3] + [(None, 'no name', 'keyword 3,')] + products[4:])
+    res = test_client.insert_products_feed_job(feed_path)
+    assert res.status == 'error' and res.data == 2
+    feed_path.write_text(feed_path.read_text().replace('null', '"product 3"').replace('no name', 'description 3'))
+    res = test_client.insert_products_feed_job(feed_path)
+    assert res.status == 'success' and res.data == 3
+    rows = test_client.exec_sql_query("SELECT name, description, keywords FROM products ORDER BY id;").data
+    assert rows == products
+
+
+def test_products_feed_without_trailing_newline(test_client, tmp_path):
+    """
+    A feed whose last record has no line break is resumed after that record rather than loaded again, also when a
+    record is appended to it later.
+    :param tmp_path: temp folder for the feed file
+    :return: None. assert the loaded products.
+    """
+    feed_path = tmp_path / 'products.csv'
+    feed_path.write_text('name,description,keywords\npixel 8,pixel 8,"pixel 8,"\n'
+                         'shkatulka,russian learning book,"languages,"')
+    assert test_client.insert_products_feed_job(feed_path).data == 2
+    assert test_client.insert_products_feed_job(feed_path).data == 0
+    with open(feed_path, 'a') as feed:
+        feed.write('\npixel 9,pixel 9,"pixel 9,"\n')
+    assert test_client.insert_products_feed_job(feed_path).data == 1
+    names = test_client.exec_sql_query("SELECT name FROM products ORDER BY id;").data
+    assert [name for name, in names] == ['pixel 8', 'shkatulka', 'pixel 9']
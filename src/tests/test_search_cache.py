@@ -0,0 +1,52 @@
+from clients.api.search_cache import SearchResultCache
+from clients.db.data_base_client import DataBaseClient
+
+
+def test_search_cache_invalidation():
+    """
+    A cached search result is not served after a write invalidates the cache, nor when it was queried while a
+    write committed.
+    :return: None. assert the cached result per generation.
+    """
+    cache = SearchResultCache(max_size=2, ttl=60)
+    result = {"status": "success", "data": [], "msg": "No Data Found"}
+    cache.put(('leisure time', 3), result, cache.generation)
+    assert cache.get(('leisure time', 3)) == result
+    generation = cache.generation
+    cache.invalidate()
+    assert cache.get(('leisure time', 3)) is None
+    cache.put(('leisure time', 3), result, generation)
+    assert cache.get(('leisure time', 3)) is None, "a result of an older generation is cached"
+
+
+def test_search_cache_eviction():
+    """
+    The cache keeps up to max_size results, evicting the least recently used one.
+    :return: None. assert which results remain cached.
+    """
+    cache = SearchResultCache(max_size=2, ttl=60)
+    for term in ('pixel', 'phone'):
+        cache.put((term, 3), {"data": term}, cache.generation)
+    cache.get(('pixel', 3))
+    cache.put(('google', 3), {"data": 'google'}, cache.generation)
+    assert cache.get(('phone', 3)) is None
+    assert cache.get(('pixel', 3)) == {"data": 'pixel'}
+    assert cache.get(('google', 3)) == {"data": 'google'}
+
+
+def test_search_cache_other_process_writes(tmp_path):
+    """
+    A cached search result is not served after another connection (e.g. of another process) commits to the DB.
+    :param tmp_path: temp folder for the DB file
+    :return: None. assert the cached result before and after the other connection's commit.
+    """
+    client, other_client = DataBaseClient(str(tmp_path / 'search.db')), DataBaseClient(str(tmp_path / 'search.db'))
+    cache = SearchResultCache(max_size=2, ttl=60, data_version=client.pool.data_version)
+    result = {"status": "success", "data": [], "msg": "No Data Found"}
+    cache.put(('leisure time', 3), result, cache.generation)
+    client.exec_sql_query("SELECT count() FROM sqlite_master;", read_only=True)
+    assert cache.get(('leisure time', 3)) == result
+    other_client.exec_sql_query("CREATE TABLE numbers (n integer);")
+    assert cache.get(('leisure time', 3)) is None
+    client.close()
+    other_client.close()
@@ -1,7 +1,11 @@
+import os
+import sqlite3
 import pytest
 from tests import settings
 from importlib.resources import contents
 from conftest import cfg_get_data
+from clients.api import ranking_recompute, search_web_activities
+from clients.api.search_snapshot import SearchSnapshot
 
 
 @pytest.mark.parametrize('test_name',contents(settings.cfg_tests_dir)) #  ['test_empty_keywords.json'])
@@ -39,3 +43,283 @@ def test_search_results(test_client, test_name):
     r = test_client.validate_test_result(res, cfg_data, 'search_results')
     # check that the search results order is correct as well as the retrieved unique url
     assert r is True, F"wrong results; expected: {cfg_data['results']['search_results']}, actual: {res['data']}"
+
+
+def test_full_text_search(test_client):
+    """
+    The search matches free text (any words, the last one as a prefix) in the products' name, description and
+    keywords, not only a whole keyword.
+    :return: None. assert the websites found by name, description and prefix searches.
+    """
+    test_client.insert_products_job()
+    test_client.insert_new_site_into_search_engine_api('www.ozon.ru', 'shkatulka', {"key1": "languages",
+                                                                                   "key2": "leisure time"}, 5, 4)
+    test_client.insert_new_site_into_search_engine_api('www.googlestore.com', 'pixel 8', {"key1": "pixel 8",
+                                                                                         "key2": "leisure time"}, 40, 1)
+    test_client.update_ranking_job()
+    for search_term, expected in (('Russian Book', ['www.ozon.ru']), ('pix', ['www.googlestore.com']),
+                                  ('leisure', ['www.ozon.ru', 'www.googlestore.com']), ('no such words', [])):
+        res = test_client.get_search_term_options(search_term)
+        assert res['status'] == 'success', F"Error occurred {res['data']}"
+        actual = [option['product_page_url'] for option in res['data']]
+        assert actual == expected, F"wrong results for {search_term}; expected: {expected}, actual: {actual}"
+
+
+def insert_gizmo_catalog(client):
+    """
+    insert and rank a catalog whose search for 'gizmo' matches products of various text relevance, whose websites'
+    ranks disagree with it: the more relevant the product, the lower ranked its websites
+    :param client: the test client
+    """
+    # gizmo is rare in the catalog, so its bm25 relevance tells the products apart
+    client.insert_products_job()
+    products = [('gizmo', 'gizmo gizmo gizmo', 'gizmo,'),
+                ('gadget', 'a gadget which works with a gizmo and many other devices', 'gadget,'),
+                ('gizmo case', 'a case for a gizmo', 'case,')]
+    products += [(F"device {idx}", F"another device {idx}", 'device,') for idx in range(10)]
+    for product in products:
+        client.exec_sql_query("INSERT INTO products (name, description, keywords) VALUES (?, ?, ?);", params=product)
+    for idx in range(6):
+        for product, keyword, seniority in (('gizmo', 'gizmo', 40 + idx), ('gadget', 'gadget', 60 + idx),
+                                            ('gizmo case', 'case', 50 + idx)):
+            client.insert_new_site_into_search_engine_api(F"www.{keyword}{idx}.com", product, {"key1": keyword},
+                                                          seniority, 1)
+    client.update_ranking_job()
+
+
+def test_search_pagination(test_client):
+    """
+    A website scores the same on every page: paging through the search results with the continuation cursor, with
+    any page size, returns the options of a single page, which are the matching websites ordered by the blend of
+    their rank and their product's text relevance (a relevant product's lower ranked websites come first).
+    :return: None. assert the concatenated pages against a single page and against the blended order.
+    """
+    insert_gizmo_catalog(test_client)
+    params = test_client.search_params('gizmo', 100)
+    blended = test_client.exec_sql_query("""
+        SELECT wp.unique_url FROM (
+            SELECT rowid AS product_id,
+                   max(-bm25(products_fts, :name_weight, :description_weight, :keywords_weight), 0) AS relevance
+            FROM products_fts WHERE products_fts MATCH :search_term) m
+        JOIN websites_products wp ON wp.product_id = m.product_id
+        JOIN website_scores rnk ON rnk.website_product_rel_id = wp.id
+        ORDER BY :rank_weight * rnk.SumVal / (rnk.SumVal + :rank_scale) +
+                 :text_weight * m.relevance / (m.relevance + :text_scale) desc,
+                 rnk.SumVal desc, rnk.MaxGradeAndValue desc, wp.id desc;""", params=params).data
+    blended = [unique_url for unique_url, in blended]
+    ranked = test_client.exec_sql_query("""SELECT wp.unique_url FROM website_scores rnk
+                                           JOIN websites_products wp ON wp.id = rnk.website_product_rel_id
+                                           ORDER BY rnk.SumVal desc;""").data
+    assert ranked[0][0].startswith('www.gadget') and not blended[0].startswith('www.gadget')
+    single_page = test_client.get_search_term_options('gizmo', limit=100)
+    assert single_page['status'] == 'success' and single_page['next_cursor'] is None
+    assert [option['product_unique_url'] for option in single_page['data']] == blended
+    for limit in (1, 2, 3, 5):
+        options, cursor = [], None
+        while True:
+            page = test_client.get_search_term_options('gizmo', limit=limit, cursor=cursor)
+            assert page['status'] == 'success', F"Error occurred {page['data']}"
+            assert page['data'] == single_page['data'][len(options):len(options) + limit]
+            options += page['data']
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert options == single_page['data'], F"wrong pages of {limit}; expected: {single_page['data']}, " \
+                                               F"actual: {options}"
+
+
+
+def test_search_invalid_limit(test_client):
+    """
+    A page size which is not a positive integer is rejected rather than answered with an empty page.
+    :return: None. assert the error results.
+    """
+    for limit in (0, -1, 2.5, '3'):
+        for mode in ('db', 'snapshot'):
+            res = test_client.get_search_term_options('leisure time', limit=limit, mode=mode)
+            assert res['status'] == 'error' and res['msg'] == 'Invalid Limit', F"limit {limit!r} is not rejected"
+
+
+def test_search_pagination_while_ranking(ranked_client):
+    """
+    Websites which are ranked between the pages do not shift the next pages: the former websites are neither
+    skipped nor repeated.
+    :return: None. assert every former website is paged exactly once.
+    """
+    former = {option['product_unique_url']
+              for option in ranked_client.get_search_term_options('leisure time', limit=10)['data']}
+    page = ranked_client.get_search_term_options('leisure time', limit=2)
+    options = page['data']
+    # a website ranked above the first page and one ranked below it
+    for url, seniority, ref in (('www.top.com', 1000, 100), ('www.bottom.com', 1, 0)):
+        ranked_client.insert_new_site_into_search_engine_api(url, 'shkatulka', {"key1": "languages",
+                                                                                "key2": "leisure time"}, seniority, ref)
+    ranked_client.update_ranking_job()
+    while page['next_cursor']:
+        page = ranked_client.get_search_term_options('leisure time', limit=2, cursor=page['next_cursor'])
+        assert page['status'] == 'success', F"Error occurred {page['data']}"
+        options += page['data']
+    unique_urls = [option['product_unique_url'] for option in options]
+    assert len(unique_urls) == len(set(unique_urls)), F"repeated options: {unique_urls}"
+    assert former <= set(unique_urls), F"skipped options: {former - set(unique_urls)}"
+    assert any(url.startswith('www.bottom.com') for url in unique_urls)
+    assert not any(url.startswith('www.top.com') for url in unique_urls)
+
+
+def test_update_ranking_replay(sites_client):
+    """
+    update_ranking_job deletes the websites it ranked from the queue, and running it again, or ranking queued
+    websites again, neither duplicates the ranking rows nor changes the website scores.
+    :return: None. assert the queue, the ranking rows and the website scores after each run.
+    """
+    queue_query = "SELECT count() FROM ranking_job_queue;"
+    queued = sites_client.exec_sql_query(queue_query, fetch_all=False).data
+    assert sites_client.update_ranking_job(chunk_size=2)['msg'] == 'update_ranking_job succeeded'
+    ranking_query = """SELECT website_product_rel_id, parameter_id, parameter_value FROM search_engine_ranking
+                       ORDER BY website_product_rel_id, parameter_id;"""
+    scores_query = "SELECT * FROM website_scores ORDER BY website_product_rel_id;"
+    ranking, scores = sites_client.exec_sql_query(ranking_query).data, sites_client.exec_sql_query(scores_query).data
+    assert len(ranking) == 3 * queued and len(scores) == queued
+    assert sites_client.exec_sql_query(queue_query, fetch_all=False).data == 0
+    assert sites_client.update_ranking_job(chunk_size=2)['msg'] == 'No Data Found'
+    requeue_query = """INSERT INTO ranking_job_queue (websites_products_id, seniority)
+                       SELECT website_product_rel_id, parameter_units FROM search_engine_ranking
+                       WHERE parameter_id = (SELECT id FROM ranking_parameters WHERE name = 'seniority')
+                       ORDER BY website_product_rel_id;"""
+    sites_client.exec_sql_query(requeue_query)
+    assert sites_client.update_ranking_job(chunk_size=2)['msg'] == 'update_ranking_job succeeded'
+    assert sites_client.exec_sql_query(ranking_query).data == ranking
+    assert sites_client.exec_sql_query(scores_query).data == scores
+    assert sites_client.exec_sql_query(queue_query, fetch_all=False).data == 0
+
+
+def test_enqueue_legacy_jobs_file(sites_client):
+    """
+    The websites pending in a jobs file of a former version are moved into ranking_job_queue, and ranked by
+    update_ranking_job.
+    :return: None. assert the queued websites, the removed file and the ranking rows.
+    """
+    queue_query = "SELECT websites_products_id, seniority FROM ranking_job_queue ORDER BY id;"
+    pending = sites_client.exec_sql_query(queue_query).data
+    assert pending
+    # the former versions wrote a "websites_products_id seniority" line per website
+    sites_client.exec_sql_query("DELETE FROM ranking_job_queue;")
+    with open(sites_client.data_jobs_path, 'w') as rank_file:
+        rank_file.writelines(F"{websites_products_id} {seniority}\n" for websites_products_id, seniority in pending)
+    assert sites_client.enqueue_legacy_jobs_file() == len(pending)
+    assert not os.path.exists(sites_client.data_jobs_path)
+    assert sites_client.exec_sql_query(queue_query).data == pending
+    assert sites_client.enqueue_legacy_jobs_file() == 0
+    assert sites_client.update_ranking_job()['msg'] == 'update_ranking_job succeeded'
+    rows = sites_client.exec_sql_query("SELECT count() FROM search_engine_ranking;", fetch_all=False).data
+    assert rows == 3 * len(pending)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_recompute_ranking(ranked_client, processes):
+    """
+    After a grade_per_unit change, recompute_ranking_job rescores every ranking row (and website score) by the
+    new grades, in the job's process or in a pool of scoring processes.
+    :param processes: number of scoring processes
+    :return: None. assert the recomputed values and scores.
+    """
+    rows = ranked_client.exec_sql_query("SELECT count() FROM search_engine_ranking;", fetch_all=False).data
+    ranked_client.exec_sql_query("UPDATE ranking_parameters SET grade_per_unit = grade_per_unit * 3 "
+                                 "WHERE name = 'ref';")
+    res = ranked_client.recompute_ranking_job(processes=processes, chunk_size=2)
+    assert res == {"status": "success", "data": rows, "msg": "recompute_ranking_job succeeded"}
+    stale = ranked_client.exec_sql_query("""SELECT count() FROM search_engine_ranking r
+                                            JOIN ranking_parameters rp ON rp.id = r.parameter_id
+                                            WHERE r.parameter_grade != rp.grade_per_unit
+                                               OR r.parameter_value != r.parameter_units * rp.grade_per_unit;""",
+                                         fetch_all=False).data
+    assert stale == 0, F"{stale} ranking rows are not recomputed"
+    scores_query = "SELECT * FROM website_scores ORDER BY website_product_rel_id;"
+    scores = ranked_client.exec_sql_query(scores_query).data
+    ranked_client.rebuild_website_scores()
+    assert scores == ranked_client.exec_sql_query(scores_query).data
+
+
+def test_recompute_ranking_write_lock(ranked_client, monkeypatch):
+    """
+    While recompute_ranking_job scores the ranking rows, a write of another process waits for the DB write lock
+    (here it gives up at once), rather than writing a row which the swap would drop.
+    :param monkeypatch: writes from another connection while the ranking rows are scored
+    :return: None. assert the concurrent write is locked out, and succeeds after the recompute.
+    """
+    insertion = """INSERT INTO search_engine_ranking (website_product_rel_id, parameter_id, parameter_value,
+                   parameter_grade, date_created) VALUES (1000000, 1, 1, 1, 0);"""
+    locked = []
+
+    def score_shard(*args):
+        with sqlite3.connect(ranked_client.db_path, timeout=0) as other_process:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                other_process.execute(insertion)
+        locked.append(True)
+        return ranking_recompute.score_shard(*args)
+
+    monkeypatch.setattr(search_web_activities, 'score_shard', score_shard)
+    assert ranked_client.recompute_ranking_job(processes=1)['status'] == 'success'
+    assert locked == [True]
+    with sqlite3.connect(ranked_client.db_path, timeout=0) as other_process:
+        other_process.execute(insertion)
+
+
+def test_score_rows_numpy(monkeypatch):
+    """
+    score_rows computes the same ranking rows with numpy as without it.
+    :param monkeypatch: disables numpy
+    :return: None. assert the vectorized rows against the row by row ones.
+    """
+    pytest.importorskip('numpy')
+    rows = [(1, 1, 1, 3, 2, '2024-01-01'), (2, 1, 2, 5, 0.5, '2024-01-01'), (3, 2, 3, 0, 4, '2024-01-02')]
+    vectorized = ranking_recompute.score_rows(rows)
+    monkeypatch.setattr(ranking_recompute, 'np', None)
+    assert vectorized == ranking_recompute.score_rows(rows)
+    assert all(type(row[3]) in (int, float) for row in vectorized)
+
+
+def test_search_snapshot(test_client):
+    """
+    The search snapshot serves keywords' first page as the DB search does, without a DB connection, and maps a newly
+    exported snapshot on lookup; the terms which it cannot serve are a miss, which the client searches in the DB.
+    :return: None. assert the snapshot results against the DB results.
+    """
+    insert_gizmo_catalog(test_client)
+    res = test_client.export_search_snapshot_job()
+    assert res['status'] == 'success'
+    snapshot = SearchSnapshot(test_client.search_snapshot_path, refresh_interval=0)
+    for search_term in ('gizmo', 'Gadget', 'case'):
+        expected = test_client.get_search_term_options(search_term, limit=3)['data']
+        assert snapshot.get_search_term_options(search_term, limit=3)['data'] == expected
+        assert test_client.get_search_term_options(search_term, limit=3, mode='snapshot')['data'] == expected
+    # not exported keywords, and more results of a keyword than the snapshot's top_k
+    for search_term, limit in (('giz', 3), ('gizmo', 20)):
+        assert snapshot.get_search_term_options(search_term, limit)['msg'] == 'Snapshot Miss'
+        expected = test_client.get_search_term_options(search_term, limit=limit)
+        assert test_client.get_search_term_options(search_term, limit=limit, mode='snapshot') == expected
+    test_client.insert_new_site_into_search_engine_api('www.gizmo-top.com', 'gizmo', {"key1": "gizmo"}, 1000, 100)
+    test_client.update_ranking_job()
+    test_client.export_search_snapshot_job()
+    assert snapshot.get_search_term_options('gizmo', limit=1)['data'][0]['product_page_url'] == 'www.gizmo-top.com'
+    snapshot.close()
+
+
+def test_job_statement_metrics(test_client):
+    """
+    The statements of the ingestion and ranking jobs are recorded per statement, each one under its whole text.
+    :return: None. assert the statement counters of the jobs.
+    """
+    test_client.insert_products_job()
+    test_client.metrics.reset()
+    websites = cfg_get_data('test_search_results_sorted_by_priority.json')['websites'][:5]
+    inserted = len([unique_url for unique_url in test_client.insert_new_sites(websites) if unique_url])
+    test_client.update_ranking_job()
+    counters = {(counter['job'], counter['statement']): counter for counter in test_client.metrics.counters()
+                if counter['type'] == 'statement'}
+    assert counters[('insert_new_sites', 'insert into websites (url) values (?);')]['calls'] == inserted
+    assert ('insert_new_sites', test_client.products_by_name_query) in counters
+    assert ('insert_new_sites', test_client.ranking_queries['queue_insertion']) in counters
+    for query in test_client.ranking_queries['ranking_insertion']:
+        query = ' '.join(query.format(columns=test_client.search_engine_ranking_col).split())
+        assert counters[('update_ranking_job', query)]['calls'] == 1